@@ -15,6 +15,10 @@ from pathlib import Path
 # Add src to path
 sys.path.append(str(Path(__file__).parent / "src"))
 
+from src.document_store import (
+    DOCUMENTS_PARQUET_FILE, DOCUMENTS_PICKLE_FILE, documents_file_exists, load_documents, save_documents
+)
+
 def setup_logging():
     """Setup logging configuration."""
     logging.basicConfig(
@@ -151,8 +155,7 @@ def strategy_1_ultralight():
         logger.info("Saving knowledge base...")
         faiss.write_index(index, "knowledge_vector_index.faiss")
         
-        with open("knowledge_documents.pkl", 'wb') as f:
-            pickle.dump(documents, f)
+        save_documents(documents)
         
         logger.info(f"Successfully built knowledge base with {len(documents)} chunks!")
         return True
@@ -214,8 +217,7 @@ def strategy_2_text_only():
                 continue
         
         # Save documents
-        with open("knowledge_documents.pkl", 'wb') as f:
-            pickle.dump(documents, f)
+        save_documents(documents)
         
         # Create marker for text-only mode
         with open("knowledge_text_only.marker", 'w') as f:
@@ -363,8 +365,7 @@ def strategy_3_progressive():
         
         # Final save
         faiss.write_index(index, "knowledge_vector_index.faiss")
-        with open("knowledge_documents.pkl", 'wb') as f:
-            pickle.dump(documents, f)
+        save_documents(documents)
         
         # Cleanup checkpoint
         if os.path.exists(checkpoint_file):
@@ -401,9 +402,8 @@ def main():
                 
                 # Print results
                 try:
-                    if os.path.exists("knowledge_documents.pkl"):
-                        with open("knowledge_documents.pkl", 'rb') as f:
-                            docs = pickle.load(f)
+                    if documents_file_exists():
+                        docs = load_documents()
                         
                         categories = {}
                         total_words = 0
@@ -427,7 +427,8 @@ def main():
                         print(f"💾 Files created:")
                         if os.path.exists("knowledge_vector_index.faiss"):
                             print(f"   - knowledge_vector_index.faiss")
-                        print(f"   - knowledge_documents.pkl")
+                        documents_file = DOCUMENTS_PARQUET_FILE if os.path.exists(DOCUMENTS_PARQUET_FILE) else DOCUMENTS_PICKLE_FILE
+                        print(f"   - {documents_file}")
                         if os.path.exists("knowledge_text_only.marker"):
                             print(f"   - knowledge_text_only.marker")
                         
@@ -7,7 +7,6 @@ Uses simple text indexing for fast search without memory-intensive embeddings.
 import os
 import sys
 import logging
-import pickle
 import json
 import re
 from pathlib import Path
@@ -17,6 +16,8 @@ from typing import List, Dict, Any, Set, Optional
 # Add src to path
 sys.path.append(str(Path(__file__).parent / "src"))
 
+from src.document_store import DOCUMENTS_PARQUET_FILE, DOCUMENTS_PICKLE_FILE, TOKEN_RE, load_documents, save_documents
+
 def setup_logging():
     """Setup logging configuration."""
     logging.basicConfig(
@@ -48,8 +49,8 @@ class TextKnowledgeBuilder:
     
     def extract_keywords(self, text: str) -> Set[str]:
         """Extract keywords from text."""
-        # Convert to lowercase and split
-        words = text.lower().split()
+        # Convert to lowercase and tokenize the same way queries are
+        words = TOKEN_RE.findall(text.lower())
         
         # Filter out common stop words
         stop_words = {
@@ -63,9 +64,8 @@ class TextKnowledgeBuilder:
         # Extract meaningful words (length > 2, not stop words)
         keywords = set()
         for word in words:
-            cleaned_word = re.sub(r'[^\w]', '', word)
-            if len(cleaned_word) > 2 and cleaned_word not in stop_words:
-                keywords.add(cleaned_word)
+            if len(word) > 2 and word not in stop_words:
+                keywords.add(word)
         
         return keywords
     
@@ -172,8 +172,7 @@ class TextKnowledgeBuilder:
             self.logger.info("Saving knowledge base components...")
             
             # Save documents
-            with open("knowledge_documents.pkl", 'wb') as f:
-                pickle.dump(self.documents, f)
+            save_documents(self.documents)
             
             # Save text indices
             with open("knowledge_word_index.json", 'w', encoding='utf-8') as f:
@@ -230,8 +229,7 @@ class TextSearchEngine:
         """Load the text search indices."""
         try:
             # Load documents
-            with open("knowledge_documents.pkl", 'rb') as f:
-                self.documents = pickle.load(f)
+            self.documents = load_documents()
             
             # Load indices
             with open("knowledge_word_index.json", 'r', encoding='utf-8') as f:
@@ -256,7 +254,7 @@ class TextSearchEngine:
             return []
         
         query_lower = query.lower()
-        query_words = query_lower.split()
+        query_words = TOKEN_RE.findall(query_lower)
         
         # Score documents based on matches
         doc_scores = defaultdict(float)
@@ -353,7 +351,8 @@ def main():
             print(f"🏷️  Categories: {', '.join(stats['categories'])}")
             
             print("\n💾 FILES CREATED:")
-            print("- knowledge_documents.pkl (document storage)")
+            documents_file = DOCUMENTS_PARQUET_FILE if os.path.exists(DOCUMENTS_PARQUET_FILE) else DOCUMENTS_PICKLE_FILE
+            print(f"- {documents_file} (document storage)")
             print("- knowledge_word_index.json (keyword index)")
             print("- knowledge_phrase_index.json (phrase index)")
             print("- knowledge_category_index.json (category index)")
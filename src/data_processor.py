@@ -16,6 +16,11 @@ class TicketDataProcessor:
         self.processed_df = None
         self.vectorizer = None
         self.clusters = None
+        # Incremented each time processed_df is rebuilt, so callers can key caches on it
+        self.data_version = 0
+        # Ticket ID -> row position in processed_df, rebuilt when processed_df is replaced
+        self._ticket_positions: Dict[int, int] = {}
+        self._ticket_positions_source = None
         
     def load_data(self) -> pd.DataFrame:
         """Load ticket data from CSV file."""
@@ -105,6 +110,7 @@ class TicketDataProcessor:
             df['Tracker'] = pd.Series(df['Tracker'])
         
         self.processed_df = df
+        self.data_version += 1
         return df
     
     def analyze_patterns(self) -> Dict[str, Any]:
@@ -194,16 +200,30 @@ class TicketDataProcessor:
         except Exception as e:
             return {'error': f'Clustering failed: {e}'}
     
+    def _get_ticket_positions(self) -> Dict[int, int]:
+        """Map ticket IDs to row positions, keeping the first row for duplicate IDs."""
+        df = self.processed_df
+        if self._ticket_positions_source is not df:
+            positions = {}
+            if '#' in df.columns:
+                ids = pd.to_numeric(df['#'], errors='coerce')
+                for position, ticket_id in enumerate(ids):
+                    if pd.notna(ticket_id):
+                        positions.setdefault(int(ticket_id), position)
+            self._ticket_positions = positions
+            self._ticket_positions_source = df
+        return self._ticket_positions
+    
     def get_ticket_by_id(self, ticket_id: int) -> Optional[Dict[str, Any]]:
         """Get a specific ticket by ID."""
         if self.processed_df is None:
             return None
-            
-        ticket = self.processed_df[self.processed_df['#'] == ticket_id]
-        if len(ticket) == 0:
+        
+        position = self._get_ticket_positions().get(ticket_id)
+        if position is None:
             return None
             
-        return ticket.iloc[0].to_dict()
+        return self.processed_df.iloc[position].to_dict()
     
     def search_tickets(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search tickets by text query."""
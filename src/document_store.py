@@ -0,0 +1,170 @@
+"""
+Persistent storage for knowledge base documents.
+Documents are written as a columnar Parquet table and memory-mapped on load,
+with a pickle fallback when pyarrow is not installed.
+"""
+
+import os
+import re
+import pickle
+import logging
+from typing import List, Dict, Any, Iterator, Sequence, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+DOCUMENTS_PARQUET_FILE = "knowledge_documents.parquet"
+DOCUMENTS_PICKLE_FILE = "knowledge_documents.pkl"
+
+# Pre-lowercased copy of text_content used for substring scans
+TEXT_LOWER_COLUMN = "_text_lower"
+
+# Tokenizer shared by word-index builds and queries so their keys match
+TOKEN_RE = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+
+class ArrowDocuments(Sequence):
+    """
+    Read-only list-of-dicts view over a memory-mapped document table.
+    Rows are materialized as dicts only when accessed; missing values are
+    omitted so `doc.get(key, default)` behaves like the pickled documents.
+    """
+
+    def __init__(self, table: "pa.Table"):
+        self.table = table
+        self._fields = [name for name in table.column_names if not name.startswith('_')]
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+
+        row = {}
+        for name in self._fields:
+            value = self.table.column(name)[index].as_py()
+            if value is not None:
+                row[name] = value
+        return row
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for batch in self.table.select(self._fields).to_batches():
+            for row in batch.to_pylist():
+                yield {key: value for key, value in row.items() if value is not None}
+
+    def column(self, name: str) -> List[Any]:
+        """Get a single column as a Python list."""
+        return self.table.column(name).to_pylist()
+
+    def ids_containing(self, query_lower: str) -> List[str]:
+        """Get IDs of documents whose lowercased text contains the query."""
+        if TEXT_LOWER_COLUMN in self.table.column_names:
+            text_lower = self.table.column(TEXT_LOWER_COLUMN)
+        else:
+            text_lower = pc.utf8_lower(self.table.column('text_content'))
+
+        mask = pc.fill_null(pc.match_substring(text_lower, query_lower), False)
+        return pc.filter(self.table.column('id'), mask).to_pylist()
+
+
+class ColumnDocuments(Sequence):
+    """List-of-dicts view over a dict of equal-length columns."""
+
+    def __init__(self, columns: Dict[str, Sequence[Any]]):
+        self.columns = columns
+        self._length = len(next(iter(columns.values()), []))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+
+        return {name: values[index] for name, values in self.columns.items()}
+
+    def column(self, name: str) -> List[Any]:
+        """Get a single column as a Python list."""
+        return list(self.columns[name])
+
+
+def documents_file_exists() -> bool:
+    """Check if a saved document store exists in either format."""
+    return os.path.exists(DOCUMENTS_PARQUET_FILE) or os.path.exists(DOCUMENTS_PICKLE_FILE)
+
+
+def save_documents(documents: Union[List[Dict[str, Any]], Dict[str, Sequence[Any]]]) -> str:
+    """
+    Save documents, preferring the columnar Parquet format.
+
+    Args:
+        documents: List of document/chunk dicts, or a dict of equal-length columns
+
+    Returns:
+        Path of the written file
+    """
+    if ARROW_AVAILABLE and documents:
+        try:
+            if isinstance(documents, dict):
+                columns = {key: list(values) for key, values in documents.items()}
+            else:
+                # Collect the union of keys, preserving first-seen order
+                fields = {}
+                for doc in documents:
+                    for key in doc:
+                        fields.setdefault(key, None)
+                columns = {key: [doc.get(key) for doc in documents] for key in fields}
+
+            table = pa.table(columns)
+            if 'text_content' in columns:
+                table = table.append_column(TEXT_LOWER_COLUMN, pc.utf8_lower(table.column('text_content')))
+
+            pq.write_table(table, DOCUMENTS_PARQUET_FILE)
+            _remove_if_exists(DOCUMENTS_PICKLE_FILE)
+            return DOCUMENTS_PARQUET_FILE
+
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning(f"Could not store documents as Parquet, falling back to pickle: {e}")
+
+    with open(DOCUMENTS_PICKLE_FILE, 'wb') as f:
+        pickle.dump(documents, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _remove_if_exists(DOCUMENTS_PARQUET_FILE)
+    return DOCUMENTS_PICKLE_FILE
+
+
+def load_documents() -> Sequence[Dict[str, Any]]:
+    """Load documents, memory-mapping the Parquet store when available."""
+    if ARROW_AVAILABLE and os.path.exists(DOCUMENTS_PARQUET_FILE):
+        return ArrowDocuments(pq.read_table(DOCUMENTS_PARQUET_FILE, memory_map=True))
+
+    with open(DOCUMENTS_PICKLE_FILE, 'rb') as f:
+        documents = pickle.load(f)
+
+    # Column stores are pickled as a dict of parallel arrays
+    if isinstance(documents, dict):
+        return ColumnDocuments(documents)
+    return documents
+
+
+def _remove_if_exists(file_path: str) -> None:
+    """Remove a stale store written in the other format."""
+    if os.path.exists(file_path):
+        os.remove(file_path)
@@ -26,7 +26,8 @@ class EnhancedTicketAgent:
         # Initialize both systems
         self.ticket_agent = SimpleTicketAgent("sample_tickets_template.csv", gemini_api_key)
         self.knowledge_store = KnowledgeVectorStore()
-        self.translation_service = TranslationService(gemini_api_key)
+        # Reuse the ticket embedding model to match near-identical translation requests
+        self.translation_service = TranslationService(gemini_api_key, embed=self.ticket_agent.vector_store.embed)
         self.knowledge_ready = self.knowledge_store.is_built()
     
     def ensure_knowledge_ready(self):
@@ -13,11 +13,14 @@ from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 # Add src to path for imports
 sys.path.append(str(Path(__file__).parent))
 
+from document_store import DOCUMENTS_PARQUET_FILE, DOCUMENTS_PICKLE_FILE, TOKEN_RE, documents_file_exists, load_documents
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,7 +29,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="AI Support Agent - Knowledge Base API",
     description="API for managing and updating the knowledge base",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -40,9 +44,16 @@ app.add_middleware(
 
 # Global variables
 knowledge_builder = None
+knowledge_store = None
+# knowledge_stats.json mtime when knowledge_store was loaded; a build or clear in another
+# worker process changes it, so the loaded index is dropped
+_knowledge_store_key = None
 last_build_time = None
 build_in_progress = False
 
+# Memoized /stats response, keyed on (knowledge_stats.json mtime, build_in_progress)
+_stats_cache = {"key": None, "value": None}
+
 # Pydantic models
 class KnowledgeStats(BaseModel):
     """Knowledge base statistics."""
@@ -89,8 +100,17 @@ def get_knowledge_stats() -> KnowledgeStats:
     """Get current knowledge base statistics."""
     global last_build_time, build_in_progress
     
+    # Return the cached stats if neither the stats file nor the build state changed
+    try:
+        stats_mtime = os.stat("knowledge_stats.json").st_mtime_ns
+    except FileNotFoundError:
+        stats_mtime = None
+    cache_key = (stats_mtime, build_in_progress)
+    if _stats_cache["key"] == cache_key and _stats_cache["value"] is not None:
+        return _stats_cache["value"]
+    
     # Check for different knowledge base types
-    has_vector = os.path.exists("knowledge_vector_index.faiss") and os.path.exists("knowledge_documents.pkl")
+    has_vector = os.path.exists("knowledge_vector_index.faiss") and documents_file_exists()
     has_text = os.path.exists("knowledge_text_search.marker")
     
     knowledge_type = "none"
@@ -104,7 +124,7 @@ def get_knowledge_stats() -> KnowledgeStats:
     
     # Try to load stats from files
     try:
-        if os.path.exists("knowledge_stats.json"):
+        if stats_mtime is not None:
             with open("knowledge_stats.json", "r") as f:
                 stats: dict[str, Union[str, int]] = json.load(f)
                 total_documents = int(stats.get("total_documents", 0))
@@ -117,13 +137,39 @@ def get_knowledge_stats() -> KnowledgeStats:
     
     build_status = "building" if build_in_progress else "ready" if knowledge_type != "none" else "not_built"
     
-    return KnowledgeStats(
+    knowledge_stats = KnowledgeStats(
         total_documents=total_documents,
         total_chunks=total_chunks,
         last_updated=last_build_time,
         build_status=build_status,
         knowledge_type=knowledge_type
     )
+    _stats_cache["key"] = cache_key
+    _stats_cache["value"] = knowledge_stats
+    return knowledge_stats
+
+
+def get_knowledge_store():
+    """Get the process-wide knowledge store, loading its index on first use
+    and reloading it after the knowledge base was rebuilt or cleared."""
+    global knowledge_store, _knowledge_store_key
+    
+    try:
+        stats_mtime = os.stat("knowledge_stats.json").st_mtime_ns
+    except FileNotFoundError:
+        stats_mtime = None
+    if stats_mtime != _knowledge_store_key:
+        knowledge_store = None
+    
+    if knowledge_store is None:
+        from .knowledge_vector_store import KnowledgeVectorStore
+        store = KnowledgeVectorStore()
+        if not store.load_index():
+            raise RuntimeError("Could not load knowledge index")
+        knowledge_store = store
+        _knowledge_store_key = stats_mtime
+    
+    return knowledge_store
 
 
 def save_knowledge_stats(stats: dict[str, Union[str, int]]) -> None:
@@ -137,7 +183,7 @@ def save_knowledge_stats(stats: dict[str, Union[str, int]]) -> None:
 
 def build_knowledge_base_task(build_type: str = "text") -> dict[str, Union[str, bool, dict[str, Union[str, int]]]]:
     """Background task to build knowledge base."""
-    global knowledge_builder, last_build_time, build_in_progress
+    global knowledge_builder, knowledge_store, last_build_time, build_in_progress
     
     try:
         build_in_progress = True
@@ -193,6 +239,8 @@ def build_knowledge_base_task(build_type: str = "text") -> dict[str, Union[str,
         }
     finally:
         build_in_progress = False
+        knowledge_store = None
+        _stats_cache["key"] = None
 
 
 @app.get("/", response_model=dict[str, Union[str, list[str]]])
@@ -302,18 +350,20 @@ async def search_knowledge_base(request: SearchRequest):
         if has_vector:
             # Use vector search (implement based on your vector store)
             try:
-                from .knowledge_vector_store import KnowledgeVectorStore
-                vector_store = KnowledgeVectorStore("knowledge_vector_index.faiss")
-                search_results = vector_store.search(request.query, request.limit)
+                vector_store = get_knowledge_store()
                 
-                results = [
-                    SearchResult(
-                        content=str(result.get("content", "")),
-                        score=float(result.get("score", 0.0)),
-                        metadata=dict(result.get("metadata", {}))
-                    )
-                    for result in search_results
-                ]
+                for hit in vector_store.search_scored(request.query, request.limit):
+                    doc = vector_store.get_document_by_id(hit.doc_id)
+                    if doc is None:
+                        continue
+                    results.append(SearchResult.model_construct(
+                        content=str(doc.get("text_content", "")),
+                        score=hit.score,
+                        metadata={
+                            key: doc[key] for key in ("title", "category", "filename")
+                            if key in doc
+                        }
+                    ))
             except Exception as e:
                 logger.warning(f"Vector search failed: {e}")
         
@@ -326,7 +376,7 @@ async def search_knowledge_base(request: SearchRequest):
                         word_index: dict[str, list[int]] = json.load(f)
                     
                     # Simple text search (implement more sophisticated search as needed)
-                    query_words = request.query.lower().split()
+                    query_words = TOKEN_RE.findall(request.query.lower())
                     matching_docs = set()
                     
                     for word in query_words:
@@ -334,10 +384,8 @@ async def search_knowledge_base(request: SearchRequest):
                             matching_docs.update(word_index[word])
                     
                     # Load document content
-                    if os.path.exists("knowledge_documents.pkl"):
-                        import pickle
-                        with open("knowledge_documents.pkl", "rb") as f:
-                            documents: list[dict[str, Union[str, dict[str, Union[str, int]]]]] = pickle.load(f)
+                    if documents_file_exists():
+                        documents = load_documents()
                         
                         for doc_id in list(matching_docs)[:request.limit]:
                             if doc_id < len(documents):
@@ -346,7 +394,7 @@ async def search_knowledge_base(request: SearchRequest):
                                 content_str = str(content)[:500] if content else ""
                                 metadata = doc.get("metadata", {})
                                 metadata_dict = dict(metadata) if isinstance(metadata, dict) else {}
-                                results.append(SearchResult(
+                                results.append(SearchResult.model_construct(
                                     content=content_str,
                                     score=0.8,  # Default score for text search
                                     metadata=metadata_dict
@@ -355,11 +403,14 @@ async def search_knowledge_base(request: SearchRequest):
             except Exception as e:
                 logger.warning(f"Text search failed: {e}")
         
-        return SearchResponse(
+        # Results are built from trusted internal data, so skip validation here
+        # and in FastAPI's response_model check by returning the response directly
+        search_response = SearchResponse.model_construct(
             results=results,
             total_found=len(results),
             query=request.query
         )
+        return ORJSONResponse(search_response.model_dump())
         
     except HTTPException:
         raise
@@ -421,7 +472,8 @@ async def clear_knowledge_base():
     try:
         files_to_remove = [
             "knowledge_vector_index.faiss",
-            "knowledge_documents.pkl",
+            DOCUMENTS_PARQUET_FILE,
+            DOCUMENTS_PICKLE_FILE,
             "knowledge_text_search.marker",
             "knowledge_word_index.json",
             "knowledge_phrase_index.json",
@@ -435,9 +487,11 @@ async def clear_knowledge_base():
                 os.remove(file_path)
                 removed_files.append(file_path)
         
-        global last_build_time, build_in_progress
+        global knowledge_store, last_build_time, build_in_progress
         last_build_time = None
         build_in_progress = False
+        knowledge_store = None
+        _stats_cache["key"] = None
         
         return {
             "success": True,
@@ -480,4 +534,13 @@ async def list_documents():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(
+        "knowledge_api:app",
+        host="0.0.0.0",
+        port=8000,
+        # Build state (build_in_progress, last_build_time) is per process, so more
+        # than one worker can run concurrent builds and report stale status
+        workers=int(os.getenv("API_WORKERS", 1)),
+        loop="uvloop",
+        http="httptools"
+    ) 
\ No newline at end of file
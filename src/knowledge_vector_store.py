@@ -1,20 +1,39 @@
 import os
-import pickle
 import json
+import heapq
 import logging
+from operator import itemgetter
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 from collections import defaultdict
+from dataclasses import dataclass
 
 # Try to import vector search dependencies
 try:
     from sentence_transformers import SentenceTransformer
     import faiss
     import numpy as np
+    import torch
     VECTOR_SEARCH_AVAILABLE = True
 except ImportError:
     VECTOR_SEARCH_AVAILABLE = False
 
+from .document_store import TOKEN_RE, ArrowDocuments, documents_file_exists, load_documents
+
+# Below this many vectors the indexed vectors are copied into a dense tensor
+# (~75 MB at d=384, fp32) and searched with an exact matmul + topk; larger
+# indexes stay memory-mapped and are searched through FAISS
+TORCH_SEARCH_MAX_VECTORS = 50_000
+
+
+@dataclass(slots=True)
+class ScoredDoc:
+    """A search hit that references a document by ID instead of copying it."""
+    doc_id: str
+    score: float
+    search_type: str
+
+
 class KnowledgeVectorStore:
     """
     Knowledge vector store with fallback to text-search mode.
@@ -27,12 +46,18 @@ class KnowledgeVectorStore:
         self.index = None
         self.encoder = None
         self.search_mode = None
+        self._emb_tensor = None
         
         # Text-search components
         self.word_index = {}
         self.phrase_index = {}
         self.category_index = {}
         
+        # Lookups from document ID / category to positions in self.documents
+        self._doc_ids = []
+        self._doc_index = {}
+        self._docs_by_cat = defaultdict(list)
+        
         # Try to determine available search mode
         self._detect_search_mode()
     
@@ -46,7 +71,7 @@ class KnowledgeVectorStore:
         
         # Check for vector search mode
         if (os.path.exists("knowledge_vector_index.faiss") and 
-            os.path.exists("knowledge_documents.pkl") and
+            documents_file_exists() and
             VECTOR_SEARCH_AVAILABLE):
             self.search_mode = "vector_search"
             self.logger.info("Vector search mode detected")
@@ -59,12 +84,12 @@ class KnowledgeVectorStore:
     def is_built(self) -> bool:
         """Check if knowledge base is built."""
         if self.search_mode == "text_search":
-            return (os.path.exists("knowledge_documents.pkl") and 
+            return (documents_file_exists() and 
                    os.path.exists("knowledge_word_index.json") and
                    os.path.exists("knowledge_phrase_index.json"))
         elif self.search_mode == "vector_search":
             return (os.path.exists("knowledge_vector_index.faiss") and 
-                   os.path.exists("knowledge_documents.pkl"))
+                   documents_file_exists())
         return False
     
     def load_index(self) -> bool:
@@ -74,8 +99,8 @@ class KnowledgeVectorStore:
         
         try:
             # Load documents (common to both modes)
-            with open("knowledge_documents.pkl", 'rb') as f:
-                self.documents = pickle.load(f)
+            self.documents = load_documents()
+            self._build_document_lookups()
             
             if self.search_mode == "text_search":
                 return self._load_text_search_index()
@@ -88,6 +113,21 @@ class KnowledgeVectorStore:
             self.logger.error(f"Error loading index: {e}")
             return False
     
+    def _build_document_lookups(self):
+        """Index document positions by ID and category."""
+        if isinstance(self.documents, ArrowDocuments):
+            doc_ids = self.documents.column('id')
+            categories = self.documents.column('category')
+        else:
+            doc_ids = [doc['id'] for doc in self.documents]
+            categories = [doc.get('category') for doc in self.documents]
+        
+        self._doc_ids = doc_ids
+        self._doc_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self._docs_by_cat = defaultdict(list)
+        for i, category in enumerate(categories):
+            self._docs_by_cat[category].append(i)
+    
     def _load_text_search_index(self) -> bool:
         """Load text-search indices."""
         try:
@@ -114,14 +154,18 @@ class KnowledgeVectorStore:
                 self.logger.error("Vector search dependencies not available")
                 return False
             
-            # Load FAISS index
-            self.index = faiss.read_index("knowledge_vector_index.faiss")
+            # Memory-map the FAISS index read-only so the page cache is shared across workers
+            io_flags = getattr(faiss, 'IO_FLAG_MMAP', 0) | getattr(faiss, 'IO_FLAG_READ_ONLY', 0)
+            self.index = faiss.read_index("knowledge_vector_index.faiss", io_flags)
             
             # Load sentence transformer
             self.encoder = SentenceTransformer("all-MiniLM-L6-v2")
             self.encoder.eval()
             
             vector_count = getattr(self.index, 'ntotal', 0)
+            if 0 < vector_count < TORCH_SEARCH_MAX_VECTORS:
+                self._load_embedding_tensor(vector_count)
+            
             self.logger.info(f"Loaded vector search index with {vector_count} vectors")
             return True
             
@@ -129,8 +173,49 @@ class KnowledgeVectorStore:
             self.logger.error(f"Error loading vector search index: {e}")
             return False
     
+    def _load_embedding_tensor(self, vector_count: int):
+        """Copy the indexed vectors into a dense tensor for brute-force search."""
+        try:
+            vectors = self.index.reconstruct_n(0, vector_count)
+            if torch.cuda.is_available():
+                self._emb_tensor = torch.from_numpy(vectors).to('cuda', dtype=torch.float16)
+            else:
+                self._emb_tensor = torch.from_numpy(vectors)
+        except Exception as e:
+            # Index types without reconstruction support are searched through FAISS
+            self.logger.warning(f"Using FAISS search, could not load vectors into a tensor: {e}")
+            self._emb_tensor = None
+    
+    def _tensor_search(self, query_embedding: "np.ndarray", max_results: int):
+        """Exact inner-product search over the embedding tensor."""
+        with torch.inference_mode():
+            query = torch.from_numpy(query_embedding).to(self._emb_tensor.device, dtype=self._emb_tensor.dtype)
+            scores = query @ self._emb_tensor.T
+            values, indices = torch.topk(scores, min(max_results, scores.shape[1]), dim=1)
+            return values.float().cpu().numpy(), indices.cpu().numpy()
+    
+    def _faiss_search(self, query_embedding: "np.ndarray", max_results: int):
+        """Search the FAISS index, handling different FAISS API versions."""
+        try:
+            return self.index.search(query_embedding, max_results)
+        except Exception:
+            # Fallback for different FAISS versions
+            distances = np.empty((1, max_results), dtype=np.float32)
+            labels = np.empty((1, max_results), dtype=np.int64)
+            self.index.search(query_embedding, max_results, distances, labels)
+            return distances, labels
+    
     def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """Search for relevant documents."""
+        results = []
+        for hit in self.search_scored(query, max_results):
+            doc = self.get_document_by_id(hit.doc_id)
+            if doc:
+                results.append({**doc, 'search_score': hit.score, 'search_type': hit.search_type})
+        return results
+    
+    def search_scored(self, query: str, max_results: int = 5) -> List[ScoredDoc]:
+        """Search for relevant documents, returning scored document IDs."""
         if not self.documents:
             return []
         
@@ -142,10 +227,10 @@ class KnowledgeVectorStore:
             # Fallback to basic text search
             return self._fallback_search(query, max_results)
     
-    def _text_search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    def _text_search(self, query: str, max_results: int = 5) -> List[ScoredDoc]:
         """Perform text-based search."""
         query_lower = query.lower()
-        query_words = query_lower.split()
+        query_words = TOKEN_RE.findall(query_lower)
         
         # Score documents based on matches
         doc_scores = defaultdict(float)
@@ -163,57 +248,52 @@ class KnowledgeVectorStore:
                     doc_scores[doc_id] += 2.0
         
         # Direct text search as fallback
-        for doc in self.documents:
-            doc_id = doc['id']
-            if query_lower in doc.get('text_content', '').lower():
+        if isinstance(self.documents, ArrowDocuments):
+            for doc_id in self.documents.ids_containing(query_lower):
                 doc_scores[doc_id] += 0.5
+        else:
+            for doc in self.documents:
+                doc_id = doc['id']
+                if query_lower in doc.get('text_content', '').lower():
+                    doc_scores[doc_id] += 0.5
         
-        # Sort by score and return top results
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        
-        results = []
-        for doc_id, score in sorted_docs[:max_results]:
-            doc = next((d for d in self.documents if d['id'] == doc_id), None)
-            if doc:
-                result = doc.copy()
-                result['search_score'] = score
-                result['search_type'] = 'text_search'
-                results.append(result)
+        # Select the top results without sorting every match
+        top_docs = heapq.nlargest(max_results, doc_scores.items(), key=itemgetter(1))
         
-        return results
+        return [
+            ScoredDoc(doc_id, score, 'text_search')
+            for doc_id, score in top_docs
+            if doc_id in self._doc_index
+        ]
     
-    def _vector_search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    def _vector_search(self, query: str, max_results: int = 5) -> List[ScoredDoc]:
         """Perform vector similarity search."""
         if not self.index or not self.encoder:
             return []
         
         try:
-            # Create query embedding
-            query_embedding = self.encoder.encode([query], convert_to_numpy=True)
-            query_embedding = query_embedding.astype('float32')
+            # Create a unit-length float32 query embedding in the encoder's own pass
+            query_embedding = self.encoder.encode(
+                [query],
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
             
             if VECTOR_SEARCH_AVAILABLE:
-                faiss.normalize_L2(query_embedding)
+                query_embedding = np.ascontiguousarray(query_embedding, dtype=np.float32)
                 
-                # Search - handle different FAISS API versions
-                try:
-                    scores, indices = self.index.search(query_embedding, max_results)
-                except Exception:
-                    # Fallback for different FAISS versions
-                    distances = np.empty((1, max_results), dtype=np.float32)
-                    labels = np.empty((1, max_results), dtype=np.int64)
-                    self.index.search(query_embedding, max_results, distances, labels)
-                    scores, indices = distances, labels
+                if self._emb_tensor is not None:
+                    scores, indices = self._tensor_search(query_embedding, max_results)
+                else:
+                    scores, indices = self._faiss_search(query_embedding, max_results)
                 
-                results = []
-                for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                    if idx < len(self.documents):
-                        doc = self.documents[idx].copy()
-                        doc['search_score'] = float(score)
-                        doc['search_type'] = 'vector_search'
-                        results.append(doc)
-                
-                return results
+                # FAISS pads missing results with index -1
+                return [
+                    ScoredDoc(self._doc_ids[idx], float(score), 'vector_search')
+                    for score, idx in zip(scores[0], indices[0])
+                    if 0 <= idx < len(self._doc_ids)
+                ]
             else:
                 return []
             
@@ -221,7 +301,7 @@ class KnowledgeVectorStore:
             self.logger.error(f"Error in vector search: {e}")
             return []
     
-    def _fallback_search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    def _fallback_search(self, query: str, max_results: int = 5) -> List[ScoredDoc]:
         """Fallback to basic text search in document content."""
         query_lower = query.lower()
         results = []
@@ -229,12 +309,11 @@ class KnowledgeVectorStore:
         for doc in self.documents:
             content = doc.get('text_content', '').lower()
             if query_lower in content:
-                doc_copy = doc.copy()
-                doc_copy['search_score'] = 1.0
-                doc_copy['search_type'] = 'fallback_search'
-                results.append(doc_copy)
+                results.append(ScoredDoc(doc['id'], 1.0, 'fallback_search'))
+                if len(results) >= max_results:
+                    break
         
-        return results[:max_results]
+        return results
     
     def get_categories(self) -> List[str]:
         """Get available categories."""
@@ -251,9 +330,9 @@ class KnowledgeVectorStore:
         """Get documents by category."""
         if self.search_mode == "text_search" and category in self.category_index:
             doc_ids = self.category_index[category]
-            return [doc for doc in self.documents if doc['id'] in doc_ids]
+            return [self.documents[self._doc_index[doc_id]] for doc_id in doc_ids if doc_id in self._doc_index]
         else:
-            return [doc for doc in self.documents if doc.get('category') == category]
+            return [self.documents[i] for i in self._docs_by_cat.get(category, [])]
     
     def get_stats(self) -> Dict[str, Any]:
         """Get knowledge base statistics."""
@@ -299,7 +378,7 @@ class KnowledgeVectorStore:
     
     def get_document_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific document by ID."""
-        for doc in self.documents:
-            if doc['id'] == doc_id:
-                return doc
-        return None 
\ No newline at end of file
+        position = self._doc_index.get(doc_id)
+        if position is None:
+            return None
+        return self.documents[position] 
\ No newline at end of file
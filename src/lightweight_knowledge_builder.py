@@ -6,16 +6,23 @@ Uses multiple strategies to avoid memory issues.
 
 import os
 import gc
+import contextlib
 import sys
+import hashlib
 import logging
 import pickle
 import tempfile
+from array import array
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 import numpy as np
 
 # Try different embedding approaches
 try:
+    import torch
     from sentence_transformers import SentenceTransformer
     SENTENCE_TRANSFORMERS_AVAILABLE = True
 except ImportError:
@@ -28,37 +35,157 @@ except ImportError:
     FAISS_AVAILABLE = False
 
 from .document_processor import DocumentProcessor
+from .document_store import save_documents
+from .onnx_encoder import ONNX_RUNTIME_AVAILABLE, load_onnx_encoder
+
+# Loaded encoders shared by all builders in the process, keyed by model name
+# (with an ".int8" suffix for ONNX sessions)
+_ENCODER_CACHE: Dict[str, Any] = {}
+
+
+def _extract_document(processor: DocumentProcessor, file_path: Path) -> Tuple[str, Dict[str, Any]]:
+    """Extract a document's text and metadata; module-level so worker processes can run it."""
+    try:
+        return processor.extract_text_from_docx(file_path), processor.get_document_metadata(file_path)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Error processing {file_path}: {e}")
+        return "", {}
+
+
+def _extract_bounded(executor: ProcessPoolExecutor, processor: DocumentProcessor, files: Iterable[Path],
+                     window: int) -> Iterator[Tuple[Path, Tuple[str, Dict[str, Any]]]]:
+    """Extract documents in order, keeping at most `window` extractions in flight or unconsumed."""
+    pending = deque()
+    for file_path in files:
+        pending.append((file_path, executor.submit(_extract_document, processor, file_path)))
+        if len(pending) >= window:
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
+    
+    while pending:
+        file_path, future = pending.popleft()
+        yield file_path, future.result()
+
 
 class LightweightKnowledgeBuilder:
     """Memory-efficient knowledge base builder with multiple fallback strategies."""
     
     def __init__(self, use_small_model: bool = True):
         self.logger = logging.getLogger(__name__)
-        self.documents = []
+        self.documents = self._empty_documents()
+        self._encoded_count = 0
         self.use_small_model = use_small_model
         
         # Use smallest possible model for memory efficiency
         if self.use_small_model:
             self.model_name = "paraphrase-MiniLM-L3-v2"  # Only 61MB vs 384MB
             self.dimension = 384
+            self.max_seq_length = 128
         else:
             self.model_name = "all-MiniLM-L6-v2"
             self.dimension = 384
+            self.max_seq_length = 256
         
         self.encoder = None
+        self._onnx_session = None
         self.index = None
         self.document_processor = DocumentProcessor()
+        self.document_count = 0
+        
+        # Encoded vectors are collected in one growable matrix; the index is built once at save time
+        self._emb_buf = np.empty((0, self.dimension), dtype=np.float32)
+        self._emb_count = 0
+        
+        # Chunks are buffered across documents and encoded in large batches
+        self.flush_size = 512
+        self.encode_batch_size = 64
         
         # File paths
         self.index_file = "knowledge_vector_index.faiss"
-        self.documents_file = "knowledge_documents.pkl"
+        self.simple_index_file = "knowledge_simple_index.npy"
+        self.embed_cache_file = "embedding_cache.npz"
         self.temp_dir = tempfile.mkdtemp()
         
+        # Embeddings of previously encoded chunks, keyed by model + content hash
+        self.embedding_cache = self._load_embedding_cache()
+        self._used_cache_keys = set()
+        
+    @staticmethod
+    def _empty_documents() -> Dict[str, Any]:
+        """Create the column store for chunks (one parallel array per field)."""
+        return {
+            'id': [],
+            'text_content': [],
+            'title': [],
+            'category': [],
+            'filename': [],
+            'relative_path': [],
+            'parent_id': [],
+            'chunk_id': array('i'),
+            'char_count': array('i'),
+            'word_count': array('i'),
+            'is_chunk': [],
+        }
+    
+    @property
+    def chunk_count(self) -> int:
+        """Number of chunks stored so far."""
+        return len(self.documents['id'])
+    
+    def _truncate_documents(self, length: int):
+        """Drop chunks stored after the given position."""
+        for values in self.documents.values():
+            del values[length:]
+    
+    def _load_embedding_cache(self) -> Dict[str, np.ndarray]:
+        """Load the persistent embedding cache."""
+        if not os.path.exists(self.embed_cache_file):
+            return {}
+        
+        try:
+            with np.load(self.embed_cache_file) as data:
+                cache = dict(zip(data['keys'].tolist(), data['vectors']))
+            self.logger.info(f"Loaded {len(cache)} cached embeddings")
+            return cache
+        except Exception as e:
+            self.logger.warning(f"Could not load embedding cache: {e}")
+            return {}
+    
+    def _save_embedding_cache(self):
+        """Persist cached embeddings for the chunks used in this build."""
+        keys = sorted(self._used_cache_keys)
+        if not keys:
+            return
+        
+        try:
+            np.savez_compressed(
+                self.embed_cache_file,
+                keys=np.array(keys),
+                vectors=np.stack([self.embedding_cache[key] for key in keys])
+            )
+            self.logger.info(f"Saved {len(keys)} cached embeddings")
+        except Exception as e:
+            self.logger.warning(f"Could not save embedding cache: {e}")
+    
+    def _embedding_key(self, text: str) -> str:
+        """Cache key for a chunk's embedding under the current model."""
+        # Quantized vectors differ slightly from FP32 ones, so keep them apart
+        model_key = f"{self.model_name}.int8" if self._onnx_session is not None else self.model_name
+        return hashlib.sha256(f"{model_key}\0{text}".encode('utf-8')).hexdigest()
+        
     def initialize_encoder(self):
         """Initialize encoder with memory management."""
+        if ONNX_RUNTIME_AVAILABLE and self._initialize_onnx_encoder():
+            return True
+        
         if not SENTENCE_TRANSFORMERS_AVAILABLE:
             raise ImportError("sentence-transformers not available")
         
+        if self.model_name in _ENCODER_CACHE:
+            self.encoder = _ENCODER_CACHE[self.model_name]
+            self.logger.info(f"Reusing loaded model: {self.model_name}")
+            return True
+        
         try:
             # Force garbage collection before loading model
             gc.collect()
@@ -69,6 +196,20 @@ class LightweightKnowledgeBuilder:
             # Set to evaluation mode to save memory
             self.encoder.eval()
             
+            # Use every core for intra-op work; encode calls are issued one at a time
+            torch.set_num_threads(os.cpu_count() or 8)
+            try:
+                torch.set_num_interop_threads(2)
+            except RuntimeError:
+                # Can only be set once per process, before any parallel work
+                pass
+            
+            if os.getenv("ENCODER_TORCH_COMPILE", "").lower() in ("1", "true") and hasattr(torch, "compile"):
+                transformer = self.encoder[0]
+                transformer.auto_model = torch.compile(transformer.auto_model, mode='reduce-overhead', dynamic=True)
+                self.logger.info("Encoder transformer compiled with torch.compile")
+            
+            _ENCODER_CACHE[self.model_name] = self.encoder
             self.logger.info(f"Model loaded successfully, dimension: {self.dimension}")
             return True
             
@@ -76,81 +217,102 @@ class LightweightKnowledgeBuilder:
             self.logger.error(f"Failed to load model: {e}")
             return False
     
-    def process_single_document(self, file_path: Path) -> List[Dict[str, Any]]:
-        """Process a single document and return chunks."""
+    def _initialize_onnx_encoder(self) -> bool:
+        """Load the INT8 ONNX export of the model, exporting it on first use."""
+        cache_key = f"{self.model_name}.int8"
+        if cache_key in _ENCODER_CACHE:
+            self.encoder = _ENCODER_CACHE[cache_key]
+            self._onnx_session = self.encoder.session
+            return True
+        
+        self.encoder = load_onnx_encoder(self.model_name, self.max_seq_length)
+        if self.encoder is None:
+            self._onnx_session = None
+            return False
+        
+        self._onnx_session = self.encoder.session
+        _ENCODER_CACHE[cache_key] = self.encoder
+        return True
+    
+    def process_single_document(self, file_path: Path) -> int:
+        """Process a single document and append its chunks to the store."""
+        text_content, metadata = _extract_document(self.document_processor, file_path)
+        return self._add_document(file_path, text_content, metadata)
+    
+    def _add_document(self, file_path: Path, text_content: str, metadata: Dict[str, Any]) -> int:
+        """Chunk an extracted document and append its chunks to the store."""
         try:
-            # Extract text content
-            text_content = self.document_processor.extract_text_from_docx(file_path)
             if not text_content.strip():
-                return []
-            
-            # Get metadata
-            metadata = self.document_processor.get_document_metadata(file_path)
+                return 0
             
             # Create document
+            self.document_count += 1
             document = {
-                'id': f"doc_{len(self.documents) + 1}",
+                'id': f"doc_{self.document_count}",
                 'text_content': text_content,
                 'title': file_path.stem,
-                'char_count': len(text_content),
-                'word_count': len(text_content.split()),
                 **metadata
             }
             
             # Chunk the document
-            chunks = self._chunk_document(document)
+            chunk_count = self._chunk_document(document)
             
-            self.logger.info(f"Processed {file_path.name}: {len(chunks)} chunks")
-            return chunks
+            self.logger.info(f"Processed {file_path.name}: {chunk_count} chunks")
+            return chunk_count
             
         except Exception as e:
             self.logger.error(f"Error processing {file_path}: {e}")
-            return []
+            return 0
     
-    def _chunk_document(self, document: Dict[str, Any], chunk_size: int = 512, overlap: int = 50) -> List[Dict[str, Any]]:
+    def _append_chunk(self, document: Dict[str, Any], chunk_id: int, chunk_text: str, is_chunk: bool):
+        """Append one chunk's fields to the column store."""
+        columns = self.documents
+        columns['id'].append(f"{document['id']}_chunk_{chunk_id}" if is_chunk else document['id'])
+        columns['text_content'].append(chunk_text)
+        columns['title'].append(document['title'])
+        columns['category'].append(document['category'])
+        columns['filename'].append(document['filename'])
+        columns['relative_path'].append(document['relative_path'])
+        columns['parent_id'].append(document['id'])
+        columns['chunk_id'].append(chunk_id)
+        columns['char_count'].append(len(chunk_text))
+        columns['word_count'].append(len(chunk_text.split()))
+        columns['is_chunk'].append(is_chunk)
+    
+    def _chunk_document(self, document: Dict[str, Any], chunk_size: int = 512, overlap: int = 50) -> int:
         """Create smaller chunks to reduce memory usage."""
         text = document['text_content']
-        chunks = []
         
         if len(text) <= chunk_size:
-            return [document]
+            self._append_chunk(document, 0, text, is_chunk=False)
+            return 1
+        
+        # Character positions of all spaces, computed once per document
+        codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        space_positions = np.flatnonzero(codepoints == 0x20)
         
         start = 0
         chunk_id = 0
         
         while start < len(text):
             end = min(start + chunk_size, len(text))
-            chunk_text = text[start:end]
             
-            # Try to break at word boundaries
+            # Try to break at word boundaries (last space before end)
             if end < len(text):
-                last_space = chunk_text.rfind(' ')
-                if last_space > chunk_size * 0.7:
-                    end = start + last_space
-                    chunk_text = text[start:end]
-            
-            chunk = {
-                'id': f"{document['id']}_chunk_{chunk_id}",
-                'text_content': chunk_text,
-                'title': document['title'],
-                'category': document['category'],
-                'filename': document['filename'],
-                'relative_path': document['relative_path'],
-                'chunk_id': chunk_id,
-                'parent_id': document['id'],
-                'char_count': len(chunk_text),
-                'word_count': len(chunk_text.split()),
-                'is_chunk': True
-            }
+                pos = np.searchsorted(space_positions, end) - 1
+                if pos >= 0 and space_positions[pos] - start > chunk_size * 0.7:
+                    end = int(space_positions[pos])
             
-            chunks.append(chunk)
+            chunk_text = text[start:end]
+            self._append_chunk(document, chunk_id, chunk_text, is_chunk=True)
             chunk_id += 1
-            start = end - overlap
             
-            if start >= end:
+            # Stop once the final chunk reaches the end of the text
+            if end >= len(text):
                 break
+            start = end - overlap
         
-        return chunks
+        return chunk_id
     
     def build_with_streaming(self) -> bool:
         """Build knowledge base using streaming approach."""
@@ -159,12 +321,8 @@ class LightweightKnowledgeBuilder:
             if not self.initialize_encoder():
                 return False
             
-            # Initialize FAISS index
-            if FAISS_AVAILABLE:
-                self.index = faiss.IndexFlatIP(self.dimension)
-            else:
+            if not FAISS_AVAILABLE:
                 self.logger.warning("FAISS not available, using simple storage")
-                self.index = []
             
             # Get document files
             docx_files = list(self.document_processor.knowledge_path.rglob("*.docx"))
@@ -178,56 +336,40 @@ class LightweightKnowledgeBuilder:
             
             processed_count = 0
             
-            for i, file_path in enumerate(docx_files):
-                try:
-                    self.logger.info(f"Processing document {i+1}/{len(docx_files)}: {file_path.name}")
-                    
-                    # Process single document
-                    chunks = self.process_single_document(file_path)
-                    if not chunks:
-                        continue
-                    
-                    # Create embeddings for this document's chunks only
-                    texts = [chunk['text_content'] for chunk in chunks]
-                    
-                    # Process in micro-batches to save memory
-                    batch_size = 5
-                    for batch_start in range(0, len(texts), batch_size):
-                        batch_end = min(batch_start + batch_size, len(texts))
-                        batch_texts = texts[batch_start:batch_end]
-                        batch_chunks = chunks[batch_start:batch_end]
+            # Parse .docx files in worker processes while this process chunks and encodes.
+            # Workers are spawned rather than forked since the encoder may already run threads,
+            # and only a few extracted texts are buffered at a time.
+            max_workers = max(1, (os.cpu_count() or 2) // 2)
+            
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                extracted = _extract_bounded(executor, self.document_processor, docx_files, 2 * max_workers)
+                
+                for i, (file_path, (text_content, metadata)) in enumerate(extracted):
+                    try:
+                        self.logger.info(f"Processing document {i+1}/{len(docx_files)}: {file_path.name}")
                         
-                        # Create embeddings
-                        embeddings = self.encoder.encode(batch_texts, convert_to_numpy=True)
+                        # Process single document
+                        if not self._add_document(file_path, text_content, metadata):
+                            continue
+                        processed_count += 1
                         
-                        # Normalize and add to index
-                        if FAISS_AVAILABLE:
-                            embeddings_normalized = embeddings.astype('float32')
-                            faiss.normalize_L2(embeddings_normalized)
-                            self.index.add(embeddings_normalized)
-                        else:
-                            # Store embeddings in simple list
-                            for emb in embeddings:
-                                self.index.append(emb.astype('float32'))
+                        # Buffer chunks until there are enough to feed the encoder a full batch;
+                        # documents dropped by a failed flush are no longer counted
+                        if self.chunk_count - self._encoded_count >= self.flush_size:
+                            processed_count -= self._flush_pending()
                         
-                        # Add chunks to documents
-                        self.documents.extend(batch_chunks)
+                        # Save progress every 10 documents
+                        if processed_count % 10 == 0:
+                            self._save_progress()
                         
-                        # Force garbage collection after each micro-batch
-                        del embeddings, batch_texts, batch_chunks
-                        gc.collect()
-                    
-                    processed_count += 1
-                    
-                    # Save progress every 10 documents
-                    if processed_count % 10 == 0:
-                        self._save_progress()
-                    
-                except Exception as e:
-                    self.logger.error(f"Error processing {file_path}: {e}")
-                    continue
+                    except Exception as e:
+                        self.logger.error(f"Error processing {file_path}: {e}")
+                        continue
             
-            self.logger.info(f"Successfully processed {processed_count} documents, {len(self.documents)} chunks")
+            if self.chunk_count > self._encoded_count:
+                processed_count -= self._flush_pending()
+            
+            self.logger.info(f"Successfully processed {processed_count} documents, {self.chunk_count} chunks")
             
             # Save final result
             return self._save_final()
@@ -236,6 +378,87 @@ class LightweightKnowledgeBuilder:
             self.logger.error(f"Error in streaming build: {e}")
             return False
     
+    def _flush_pending(self) -> int:
+        """
+        Encode chunks stored since the last flush and add them to the index.
+        
+        Returns:
+            Number of documents dropped because their chunks could not be encoded
+        """
+        start = self._encoded_count
+        try:
+            self._encode_chunks(self.documents['text_content'][start:])
+            self._encoded_count = self.chunk_count
+            return 0
+        except Exception as e:
+            # Keep documents and index rows aligned by dropping the failed batch, which
+            # may hold chunks of several documents buffered since the last flush
+            dropped_files = list(dict.fromkeys(self.documents['filename'][start:]))
+            dropped_documents = len(set(self.documents['parent_id'][start:]))
+            self.logger.error(
+                f"Encoding failed, dropped chunks {start}-{self.chunk_count - 1} "
+                f"of {dropped_documents} documents ({', '.join(map(str, dropped_files))}): {e}"
+            )
+            self._truncate_documents(start)
+            return dropped_documents
+    
+    def _inference_context(self):
+        """Disable autograd tracking around torch encode calls."""
+        if self._onnx_session is None and SENTENCE_TRANSFORMERS_AVAILABLE:
+            return torch.inference_mode()
+        return contextlib.nullcontext()
+    
+    def _encode_chunks(self, texts: List[str]):
+        """Encode chunk texts in one call and add them to the index."""
+        keys = [self._embedding_key(text) for text in texts]
+        
+        # Only encode chunks whose content was not embedded by a previous build
+        miss_texts = [text for text, key in zip(texts, keys) if key not in self.embedding_cache]
+        if miss_texts:
+            # Encode in length order so each batch pads to similar lengths,
+            # then restore the original chunk order
+            order = np.argsort([len(text) for text in miss_texts], kind='stable')
+            
+            # The encoder returns unit vectors, so no separate normalize_L2 pass is needed
+            with self._inference_context():
+                encoded = self.encoder.encode(
+                    [miss_texts[i] for i in order],
+                    batch_size=self.encode_batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+            encoded = encoded[np.argsort(order)].astype('float32', copy=False)
+            
+            miss_keys = [key for key in keys if key not in self.embedding_cache]
+            self.embedding_cache.update(zip(miss_keys, encoded))
+        
+        # Write vectors straight into the embedding matrix rather than stacking a temporary batch
+        rows = self._reserve_embeddings(len(keys))
+        for row, key in zip(rows, keys):
+            row[:] = self.embedding_cache[key]
+        self._used_cache_keys.update(keys)
+        self.logger.info(f"Embedding cache hits: {len(texts) - len(miss_texts)}/{len(texts)}")
+        
+        self.logger.info(f"Encoded {len(texts)} chunks ({self.chunk_count} total)")
+    
+    def _reserve_embeddings(self, count: int) -> np.ndarray:
+        """Claim the next rows of the embedding matrix, growing it geometrically."""
+        start = self._emb_count
+        end = start + count
+        if end > len(self._emb_buf):
+            grown = np.empty((max(end, 2 * len(self._emb_buf)), self.dimension), dtype=np.float32)
+            grown[:start] = self._emb_buf[:start]
+            self._emb_buf = grown
+        
+        self._emb_count = end
+        return self._emb_buf[start:end]
+    
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Encoded vectors in chunk order."""
+        return self._emb_buf[:self._emb_count]
+    
     def build_with_minimal_memory(self) -> bool:
         """Build with absolute minimal memory usage - no vector index."""
         try:
@@ -255,8 +478,7 @@ class LightweightKnowledgeBuilder:
                 try:
                     self.logger.info(f"Processing {i+1}/{len(docx_files)}: {file_path.name}")
                     
-                    chunks = self.process_single_document(file_path)
-                    self.documents.extend(chunks)
+                    self.process_single_document(file_path)
                     
                     # Force garbage collection
                     gc.collect()
@@ -266,14 +488,13 @@ class LightweightKnowledgeBuilder:
                     continue
             
             # Save documents without vector index
-            with open(self.documents_file, 'wb') as f:
-                pickle.dump(self.documents, f)
+            save_documents(self.documents)
             
             # Create a simple marker file to indicate text-only mode
             with open("knowledge_text_only.marker", 'w') as f:
                 f.write("text_search_only")
             
-            self.logger.info(f"Built text-only knowledge base with {len(self.documents)} chunks")
+            self.logger.info(f"Built text-only knowledge base with {self.chunk_count} chunks")
             return True
             
         except Exception as e:
@@ -287,30 +508,36 @@ class LightweightKnowledgeBuilder:
             with open(progress_file, 'wb') as f:
                 pickle.dump({
                     'documents': self.documents,
-                    'processed_count': len(self.documents)
-                }, f)
-            self.logger.info(f"Saved progress: {len(self.documents)} chunks")
+                    'processed_count': self.chunk_count
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.logger.info(f"Saved progress: {self.chunk_count} chunks")
         except Exception as e:
             self.logger.warning(f"Could not save progress: {e}")
     
     def _save_final(self) -> bool:
         """Save final results."""
         try:
-            # Save FAISS index if available
-            if FAISS_AVAILABLE and hasattr(self.index, 'ntotal'):
+            # Build the FAISS index with a single bulk add, if available.
+            # Vectors are stored as fp16, halving index size with negligible recall loss.
+            if FAISS_AVAILABLE and self._emb_count:
+                self.index = faiss.IndexScalarQuantizer(
+                    self.dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+                )
+                self.index.train(self.embeddings)
+                self.index.add(self.embeddings)
                 faiss.write_index(self.index, self.index_file)
                 self.logger.info(f"Saved FAISS index with {self.index.ntotal} vectors")
-            elif self.index:
-                # Save simple index
-                with open("knowledge_simple_index.pkl", 'wb') as f:
-                    pickle.dump(self.index, f)
-                self.logger.info(f"Saved simple index with {len(self.index)} vectors")
+            elif self._emb_count:
+                # Save simple index as a raw .npy array so it can be loaded with mmap_mode='r'
+                np.save(self.simple_index_file, self.embeddings)
+                self.logger.info(f"Saved simple index with {self._emb_count} vectors")
             
             # Save documents
-            with open(self.documents_file, 'wb') as f:
-                pickle.dump(self.documents, f)
+            save_documents(self.documents)
+            
+            self._save_embedding_cache()
             
-            self.logger.info(f"Saved {len(self.documents)} document chunks")
+            self.logger.info(f"Saved {self.chunk_count} document chunks")
             return True
             
         except Exception as e:
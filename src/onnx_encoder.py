@@ -0,0 +1,124 @@
+"""
+INT8-quantized ONNX Runtime encoder for sentence-transformers models.
+Shared by the ticket vector store and the knowledge base builder.
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Any, Optional
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+    ONNX_RUNTIME_AVAILABLE = True
+except ImportError:
+    ONNX_RUNTIME_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Quantized encoder exports live here as {model_name}.int8.onnx
+ONNX_MODEL_DIR = Path("models")
+
+
+class OnnxSentenceEncoder:
+    """Mean-pooled SBERT encoder running on an ONNX Runtime session."""
+    
+    def __init__(self, session: "ort.InferenceSession", tokenizer: Any, max_seq_length: int):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self._input_names = [node.name for node in session.get_inputs()]
+    
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        """Encode texts with the same call signature as SentenceTransformer.encode."""
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {}
+            for name in self._input_names:
+                if name in tokens:
+                    feeds[name] = tokens[name].astype(np.int64)
+                else:
+                    feeds[name] = np.zeros_like(tokens['input_ids'], dtype=np.int64)
+            
+            hidden = self.session.run(None, feeds)[0]
+            
+            # Mean-pool token embeddings over the attention mask
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+        
+        embeddings = np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+def export_onnx_model(model_name: str, model_path: Path) -> bool:
+    """Export the model to ONNX and apply dynamic INT8 quantization."""
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        logger.info("optimum not installed, skipping ONNX export")
+        return False
+    
+    logger.info(f"Exporting {model_name} to INT8 ONNX")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        export_dir = Path(temp_dir) / "onnx_export"
+        
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            f"sentence-transformers/{model_name}", export=True
+        )
+        model.save_pretrained(export_dir)
+        
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=export_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        )
+        
+        model_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(export_dir / "model_quantized.onnx"), str(model_path))
+    return True
+
+
+def load_onnx_encoder(model_name: str, max_seq_length: int) -> Optional[OnnxSentenceEncoder]:
+    """Load the INT8 ONNX export of a model, exporting it on first use.
+    
+    Returns None when ONNX Runtime or the export is unavailable, so callers
+    can fall back to sentence-transformers.
+    """
+    if not ONNX_RUNTIME_AVAILABLE:
+        return None
+    
+    model_path = ONNX_MODEL_DIR / f"{model_name}.int8.onnx"
+    
+    try:
+        if not model_path.exists() and not export_onnx_model(model_name, model_path):
+            return None
+        
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = os.cpu_count() or 1
+        session = ort.InferenceSession(
+            str(model_path), sess_options, providers=['CPUExecutionProvider']
+        )
+        tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{model_name}")
+        
+        logger.info(f"Loaded INT8 ONNX model: {model_path}")
+        return OnnxSentenceEncoder(session, tokenizer, max_seq_length)
+        
+    except Exception as e:
+        logger.warning(f"ONNX encoder unavailable, using sentence-transformers: {e}")
+        return None
@@ -5,13 +5,39 @@ Provides authentication, ticket retrieval, and update functionality.
 
 import requests
 import json
-from typing import Dict, List, Optional, Any, cast
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple, cast
 from dataclasses import dataclass
 from enum import Enum
 import logging
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Upper bound on requests kept in flight by bulk operations
+MAX_CONCURRENT_REQUESTS = 16
+
+# Seconds before name-to-ID lookup maps are fetched again
+LOOKUP_CACHE_TTL = 300
+
+# Lookup maps shared by all ticket managers, keyed by connection identity and map name
+_lookup_cache: Dict[Tuple[str, str], Tuple[float, Dict[str, int]]] = {}
+_lookup_cache_lock = threading.Lock()
+
+# Used when the Redmine priority list cannot be fetched
+DEFAULT_PRIORITY_IDS = {
+    'low': 1, 'normal': 2, 'high': 3, 'urgent': 4, 'immediate': 5
+}
+
 
 class RedmineAuthType(Enum):
     """Authentication types for Redmine API."""
@@ -42,6 +68,12 @@ class RedmineService:
         """Initialize Redmine service with configuration."""
         self.config = config
         self.session = requests.Session()
+        
+        # Keep enough pooled keep-alive connections for concurrent bulk requests
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         self._setup_authentication()
     
     def _setup_authentication(self):
@@ -62,21 +94,28 @@ class RedmineService:
                 'Content-Type': 'application/json'
             })
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None,
+                      params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Make a request to Redmine API."""
         url = f"{self.config.base_url.rstrip('/')}/{endpoint}"
         
+        # The session already sends Content-Type: application/json, so encode the body directly
+        body = None
+        if data is not None:
+            body = orjson.dumps(data) if ORJSON_AVAILABLE else json.dumps(data)
+        
         try:
             response = self.session.request(
                 method=method,
                 url=url,
-                json=data,
+                params=params,
+                data=body,
                 timeout=self.config.timeout
             )
             response.raise_for_status()
             
             if response.content:
-                return response.json()
+                return orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
             return {}
             
         except requests.exceptions.RequestException as e:
@@ -89,12 +128,9 @@ class RedmineService:
     def get_issue(self, issue_id: int, include: Optional[List[str]] = None) -> Dict[str, Any]:
         """Get a specific issue by ID."""
         endpoint = f"issues/{issue_id}.json"
+        params = {'include': ",".join(include)} if include else None
         
-        if include:
-            params = "?include=" + ",".join(include)
-            endpoint += params
-            
-        return self._make_request('GET', endpoint)
+        return self._make_request('GET', endpoint, params=params)
     
     def list_issues(self, 
                    project_id: Optional[int] = None,
@@ -103,22 +139,41 @@ class RedmineService:
                    limit: int = 100,
                    offset: int = 0) -> Dict[str, Any]:
         """List issues with optional filters."""
-        endpoint = "issues.json"
-        params = []
+        params: Dict[str, Any] = {'limit': limit, 'offset': offset}
         
         if project_id:
-            params.append(f"project_id={project_id}")
+            params['project_id'] = project_id
         if assigned_to_id:
-            params.append(f"assigned_to_id={assigned_to_id}")
+            params['assigned_to_id'] = assigned_to_id
         if status_id:
-            params.append(f"status_id={status_id}")
+            params['status_id'] = status_id
         
-        params.extend([f"limit={limit}", f"offset={offset}"])
+        return self._make_request('GET', "issues.json", params=params)
+    
+    def iter_issues(self,
+                    project_id: Optional[int] = None,
+                    assigned_to_id: Optional[int] = None,
+                    status_id: Optional[str] = None,
+                    limit: int = 100) -> Iterator[Dict[str, Any]]:
+        """Iterate over all matching issues, fetching the next page while the current one is consumed."""
+        def fetch(offset: int) -> Dict[str, Any]:
+            return self.list_issues(project_id=project_id, assigned_to_id=assigned_to_id,
+                                    status_id=status_id, limit=limit, offset=offset)
         
-        if params:
-            endpoint += "?" + "&".join(params)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = 0
+            pending = executor.submit(fetch, offset)
             
-        return self._make_request('GET', endpoint)
+            while pending is not None:
+                response = pending.result()
+                issues = response.get('issues', [])
+                total_count = response.get('total_count', 0)
+                
+                offset += limit
+                has_more = bool(issues) and offset < total_count
+                pending = executor.submit(fetch, offset) if has_more else None
+                
+                yield from issues
     
     def update_issue(self, issue_id: int, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update an issue with new data."""
@@ -191,8 +246,8 @@ class RedmineService:
     
     def search_issues(self, query: str, limit: int = 25) -> Dict[str, Any]:
         """Search issues by query."""
-        endpoint = f"search.json?q={query}&issues=1&limit={limit}"
-        return self._make_request('GET', endpoint)
+        params = {'q': query, 'issues': 1, 'limit': limit}
+        return self._make_request('GET', "search.json", params=params)
     
     def add_watcher(self, issue_id: int, user_id: int) -> Dict[str, Any]:
         """Add a watcher to an issue."""
@@ -209,17 +264,15 @@ class RedmineService:
         """Upload a file to Redmine."""
         upload_url = f"{self.config.base_url.rstrip('/')}/uploads.json"
         
+        # Stream the file as the raw request body; the session already carries the credentials
         with open(file_path, 'rb') as f:
-            files = {'file': (filename, f, 'application/octet-stream')}
-            
-            # Use a separate session for file upload
-            session = requests.Session()
-            if self.config.auth_type == RedmineAuthType.API_KEY:
-                session.headers.update({'X-Redmine-API-Key': self.config.api_key})
-            else:
-                session.auth = (self.config.username, self.config.password)
-                
-            response = session.post(upload_url, files=files, timeout=self.config.timeout)
+            response = self.session.post(
+                upload_url,
+                params={'filename': filename},
+                data=f,
+                headers={'Content-Type': 'application/octet-stream'},
+                timeout=self.config.timeout
+            )
             response.raise_for_status()
             
             return response.json()
@@ -232,6 +285,13 @@ class RedmineService:
             return True
         except RedmineAPIError:
             return False
+    
+    @property
+    def connection_key(self) -> str:
+        """Identify the server and credentials without exposing the secrets."""
+        credentials = self.config.api_key or f"{self.config.username}:{self.config.password}"
+        digest = hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+        return f"{self.config.base_url.rstrip('/')}#{digest}"
 
 
 class RedmineTicketManager:
@@ -240,32 +300,58 @@ class RedmineTicketManager:
     def __init__(self, redmine_service: RedmineService):
         """Initialize with a Redmine service instance."""
         self.redmine = redmine_service
-        self._status_cache = None
-        self._user_cache = None
+    
+    def _cached_lookup(self, name: str, fetch: Callable[[], Dict[str, int]]) -> Dict[str, int]:
+        """Get a lookup map shared across managers, refetching it once the TTL expires."""
+        key = (self.redmine.connection_key, name)
+        now = time.monotonic()
+        
+        with _lookup_cache_lock:
+            entry = _lookup_cache.get(key)
+        if entry is not None and now - entry[0] < LOOKUP_CACHE_TTL:
+            return entry[1]
+        
+        mapping = fetch()
+        with _lookup_cache_lock:
+            _lookup_cache[key] = (now, mapping)
+        return mapping
     
     def get_statuses(self) -> Dict[str, int]:
         """Get status name to ID mapping."""
-        if self._status_cache is None:
+        def fetch() -> Dict[str, int]:
             response = self.redmine.get_issue_statuses()
-            self._status_cache = {
+            return {
                 status['name']: status['id'] 
                 for status in response['issue_statuses']
             }
-        return self._status_cache
+        return self._cached_lookup('statuses', fetch)
     
     def get_users(self) -> Dict[str, int]:
         """Get user name to ID mapping."""
-        if self._user_cache is None:
+        def fetch() -> Dict[str, int]:
             try:
                 response = self.redmine.get_users()
-                self._user_cache = {
+                return {
                     f"{user['firstname']} {user['lastname']}": user['id']
                     for user in response['users']
                 }
             except RedmineAPIError:
-                # Fallback if we don't have admin privileges
-                self._user_cache = {}
-        return self._user_cache
+                # Fallback if we don't have admin privileges; retried after the TTL
+                return {}
+        return self._cached_lookup('users', fetch)
+    
+    def get_priorities(self) -> Dict[str, int]:
+        """Get lowercased priority name to ID mapping."""
+        def fetch() -> Dict[str, int]:
+            try:
+                response = self.redmine.get_priorities()
+                return {
+                    priority['name'].lower(): priority['id']
+                    for priority in response['issue_priorities']
+                }
+            except (RedmineAPIError, KeyError):
+                return dict(DEFAULT_PRIORITY_IDS)
+        return self._cached_lookup('priorities', fetch)
     
     def update_ticket_from_ai_analysis(self, 
                                      issue_id: int, 
@@ -276,14 +362,13 @@ class RedmineTicketManager:
         notes_parts = []
         
         # Process AI analysis results
-        if 'priority' in ai_analysis:
-            # Map AI priority to Redmine priority
-            priority_mapping = {
-                'low': 1, 'normal': 2, 'high': 3, 'urgent': 4, 'immediate': 5
-            }
-            if ai_analysis['priority'].lower() in priority_mapping:
-                updates['priority_id'] = priority_mapping[ai_analysis['priority'].lower()]
-                notes_parts.append(f"Priority updated based on AI analysis: {ai_analysis['priority']}")
+        priority = ai_analysis.get('priority')
+        if priority:
+            # Map AI priority to Redmine priority; the mapping is cached with lowercased keys
+            priority_id = self.get_priorities().get(priority.lower())
+            if priority_id is not None:
+                updates['priority_id'] = priority_id
+                notes_parts.append(f"Priority updated based on AI analysis: {priority}")
         
         if 'category' in ai_analysis:
             notes_parts.append(f"AI categorized as: {ai_analysis['category']}")
@@ -305,25 +390,29 @@ class RedmineTicketManager:
         return {'updates': updates, 'notes': notes_parts}
     
     def bulk_update_tickets(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Update multiple tickets in bulk."""
-        results = []
+        """Update multiple tickets in bulk, overlapping the API round-trips."""
+        if not updates:
+            return []
         
-        for update in updates:
-            try:
-                issue_id = update['issue_id']
-                issue_updates = update.get('updates', {})
-                
-                result = self.redmine.update_issue(issue_id, issue_updates)
-                results.append({
-                    'issue_id': issue_id,
-                    'success': True,
-                    'result': result
-                })
-            except RedmineAPIError as e:
-                results.append({
-                    'issue_id': update.get('issue_id', 'unknown'),
-                    'success': False,
-                    'error': str(e)
-                })
-        
-        return results 
\ No newline at end of file
+        max_workers = min(MAX_CONCURRENT_REQUESTS, len(updates))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._apply_update, updates))
+    
+    def _apply_update(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a single bulk update entry and report its outcome."""
+        try:
+            issue_id = update['issue_id']
+            issue_updates = update.get('updates', {})
+            
+            result = self.redmine.update_issue(issue_id, issue_updates)
+            return {
+                'issue_id': issue_id,
+                'success': True,
+                'result': result
+            }
+        except RedmineAPIError as e:
+            return {
+                'issue_id': update.get('issue_id', 'unknown'),
+                'success': False,
+                'error': str(e)
+            }
@@ -4,29 +4,143 @@ Integrates the AI support agent with SendPulse live chat system.
 """
 
 import os
+import re
 import json
 import asyncio
 import logging
-import hashlib
-import hmac
 import time
-from typing import Dict, List, Optional, Any
+import functools
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
 from datetime import datetime
 import requests
-from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass, field
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on SendPulse API calls in flight while polling
+MAX_CONCURRENT_REQUESTS = 20
+
+# Keep-alive connections pooled per host, sized above the polling fan-out to absorb bursts
+HTTP_POOL_SIZE = 50
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 30)
+
+# Messenger endpoint builders, specialized once as bound %-formatters for the polling hot path
+ACTIVE_CHATS_ENDPOINT = "/messenger/v2/chats?status=active"
+_chat_messages_endpoint = "/messenger/v2/chats/%s/messages".__mod__
+_recent_messages_endpoint = "/messenger/v2/chats/%s/messages?limit=%d".__mod__
+_chat_assignee_endpoint = "/messenger/v2/chats/%s/assignee".__mod__
+
+# Access tokens are persisted here, keyed by api_id, so restarts can reuse them
+TOKEN_CACHE_FILE = Path(os.getenv("SENDPULSE_TOKEN_CACHE", "~/.cache/sendpulse_token.json")).expanduser()
+
+# Seconds before expiry at which the polling bot refreshes the token in the background
+TOKEN_REFRESH_MARGIN = 60
+
+# Messages kept per chat; older turns are dropped
+MAX_HISTORY_MESSAGES = 200
+
+# Bounds in seconds for the adaptive polling interval
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 60
+
+# Processed message IDs remembered to avoid answering a message twice
+MAX_SEEN_MESSAGES = 10_000
+
+# Keyword replies used when no AI agent is available, in priority order
+FALLBACK_RESPONSES = [
+    (('hello', 'hi', 'hey'),
+     "Hello! I'm your AI support assistant. How can I help you today?"),
+    (('help', 'support'),
+     "I'm here to help you with support tickets and technical questions. What specific issue can I assist you with?"),
+    (('ticket', 'tickets', 'issue', 'issues', 'problem', 'problems'),
+     "I can help you analyze support tickets and find solutions. Could you provide more details about the specific ticket or issue?"),
+    (('thank', 'thanks'),
+     "You're welcome! Is there anything else I can help you with?"),
+]
+DEFAULT_FALLBACK_RESPONSE = (
+    "I understand you're looking for assistance. Could you please provide more details about what you need help with? "
+    "I can help with support ticket analysis, troubleshooting, and finding relevant documentation."
+)
+
+# Keyword -> index into FALLBACK_RESPONSES, so one tokenizing pass finds the best reply
+_FALLBACK_KEYWORDS = {
+    keyword: rank
+    for rank, (keywords, _) in enumerate(FALLBACK_RESPONSES)
+    for keyword in keywords
+}
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Short small-talk messages made only of these keywords get a canned reply without the AI agent
+FAST_REPLY_KEYWORDS = frozenset({'hello', 'hi', 'hey', 'thank', 'thanks'})
+FAST_REPLY_MAX_LENGTH = 20
 
-@dataclass
+# Markdown bold/heading markers stripped from chat replies
+_FORMATTING_RE = re.compile(r"\*\*|##")
+
+
+@dataclass(slots=True, frozen=True)
 class SendPulseConfig:
     """Configuration for SendPulse integration."""
     api_id: str
     api_secret: str
     live_chat_id: str
     base_url: str = "https://api.sendpulse.com"
+    # When set, messages are pushed to this URL and polling is only a fallback
+    webhook_url: Optional[str] = None
+    
     
+@functools.lru_cache(maxsize=512)
+def _format_chat_response(response: str) -> str:
+    """Format AI response for live chat; cached because replies often repeat."""
+    # Remove excessive formatting for chat
+    response = _FORMATTING_RE.sub('', response)
     
+    # Limit response length for chat
+    max_length = 1000
+    if len(response) > max_length:
+        response = response[:max_length] + "...\n\nWould you like me to continue with more details?"
+    
+    return response
+
+
+@functools.lru_cache(maxsize=512)
+def _fallback_response(message_lower: str) -> str:
+    """Pick a keyword-based reply for a lowercased message."""
+    # Simple keyword-based responses; the highest-priority matching keyword wins
+    ranks = [_FALLBACK_KEYWORDS[word] for word in _WORD_RE.findall(message_lower) if word in _FALLBACK_KEYWORDS]
+    if ranks:
+        return FALLBACK_RESPONSES[min(ranks)][1]
+    
+    return DEFAULT_FALLBACK_RESPONSE
+
+
+@functools.lru_cache(maxsize=512)
+def _fast_reply(message_lower: str) -> Optional[str]:
+    """Return a canned reply for a short greeting or thanks, or None if the AI should answer."""
+    if len(message_lower.strip()) >= FAST_REPLY_MAX_LENGTH:
+        return None
+    
+    # Any keyword outside small talk (help, ticket, ...) still goes to the AI agent
+    keywords = [word for word in _WORD_RE.findall(message_lower) if word in _FALLBACK_KEYWORDS]
+    if keywords and all(word in FAST_REPLY_KEYWORDS for word in keywords):
+        return _fallback_response(message_lower)
+    return None
+
+
 class SendPulseAPI:
     """SendPulse API client for live chat integration."""
     
@@ -36,12 +150,45 @@ class SendPulseAPI:
         self.access_token = None
         self.token_expires = 0
         self.session = requests.Session()
+        
+        # Retry throttled and transient failures with backoff, honoring Retry-After.
+        # Only idempotent methods are retried, so messages are never sent twice.
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self._token_lock = threading.Lock()
+        
+        # Reused for every request; only Authorization changes, when the token rotates
+        self._base_url = config.base_url
+        self._headers = {'Content-Type': 'application/json', 'Authorization': ''}
+        self._load_cached_token()
     
     def _get_access_token(self) -> str:
         """Get or refresh access token."""
         if self.access_token and time.time() < self.token_expires:
             return self.access_token
         
+        with self._token_lock:
+            # Another thread may have refreshed the token while we waited
+            if self.access_token and time.time() < self.token_expires:
+                return self.access_token
+            return self._fetch_access_token()
+    
+    def refresh_access_token(self) -> str:
+        """Fetch a new access token even if the current one is still valid."""
+        with self._token_lock:
+            return self._fetch_access_token()
+    
+    def _fetch_access_token(self) -> str:
+        """Request a new access token and persist it; callers hold the token lock."""
         url = f"{self.config.base_url}/oauth/access_token"
         data = {
             'grant_type': 'client_credentials',
@@ -50,40 +197,74 @@ class SendPulseAPI:
         }
         
         try:
-            response = self.session.post(url, data=data)
+            response = self.session.post(url, data=data, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             
             token_data = response.json()
             self.access_token = token_data['access_token']
             self.token_expires = time.time() + token_data['expires_in'] - 60  # 1 minute buffer
+            self._headers['Authorization'] = f"Bearer {self.access_token}"
             
+            self._save_cached_token()
             return self.access_token
             
         except Exception as e:
             logger.error(f"Failed to get SendPulse access token: {e}")
             raise
     
+    def _read_token_cache(self) -> Dict[str, Any]:
+        """Read all cached tokens, ignoring a missing or corrupt file."""
+        try:
+            with open(TOKEN_CACHE_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _load_cached_token(self):
+        """Reuse a still-valid token persisted by a previous process."""
+        cached = self._read_token_cache().get(self.config.api_id)
+        if cached and time.time() < cached.get('expires', 0):
+            self.access_token = cached['token']
+            self.token_expires = cached['expires']
+            self._headers['Authorization'] = f"Bearer {self.access_token}"
+            logger.info("Loaded cached SendPulse access token")
+    
+    def _save_cached_token(self):
+        """Persist the current token so the next process can skip the OAuth round-trip."""
+        try:
+            tokens = self._read_token_cache()
+            tokens[self.config.api_id] = {'token': self.access_token, 'expires': self.token_expires}
+            
+            TOKEN_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(TOKEN_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(tokens, f)
+        except OSError as e:
+            logger.warning(f"Could not cache SendPulse access token: {e}")
+    
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Make authenticated request to SendPulse API."""
-        token = self._get_access_token()
+        # Refreshes the token, and with it the Authorization header, when it has expired
+        self._get_access_token()
         
-        url = f"{self.config.base_url}{endpoint}"
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
+        # Content-Type is already application/json in the shared headers
+        body = None
+        if data is not None:
+            body = orjson.dumps(data) if ORJSON_AVAILABLE else json.dumps(data)
         
         try:
             response = self.session.request(
                 method=method,
-                url=url,
-                headers=headers,
-                json=data,
-                timeout=30
+                url=self._base_url + endpoint,
+                headers=self._headers,
+                data=body,
+                timeout=REQUEST_TIMEOUT
             )
             response.raise_for_status()
             
-            return response.json() if response.content else {}
+            if not response.content:
+                return {}
+            return orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
             
         except Exception as e:
             logger.error(f"SendPulse API request failed: {e}")
@@ -91,19 +272,27 @@ class SendPulseAPI:
     
     def get_chat_messages(self, chat_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get messages from a chat conversation."""
-        endpoint = f"/messenger/v2/chats/{chat_id}/messages"
-        params = f"?limit={limit}"
-        
         try:
-            response = self._make_request('GET', endpoint + params)
+            response = self._make_request('GET', _recent_messages_endpoint((chat_id, limit)))
             return response.get('data', [])
         except Exception as e:
             logger.error(f"Failed to get chat messages: {e}")
             return []
     
+    def get_chat_messages_bulk(self, chat_ids: List[str], limit: int = 50) -> Dict[str, List[Dict[str, Any]]]:
+        """Get recent messages for several chats, keyed by chat ID."""
+        if not chat_ids:
+            return {}
+        
+        # The messenger API has no batched endpoint, so fan out over the pooled session
+        max_workers = min(MAX_CONCURRENT_REQUESTS, len(chat_ids))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda chat_id: self.get_chat_messages(chat_id, limit), chat_ids)
+            return dict(zip(chat_ids, results))
+    
     def send_message(self, chat_id: str, message: str, message_type: str = "text") -> bool:
         """Send a message to a chat."""
-        endpoint = f"/messenger/v2/chats/{chat_id}/messages"
+        endpoint = _chat_messages_endpoint(chat_id)
         
         data = {
             "message": {
@@ -121,10 +310,8 @@ class SendPulseAPI:
     
     def get_active_chats(self) -> List[Dict[str, Any]]:
         """Get list of active chats."""
-        endpoint = f"/messenger/v2/chats?status=active"
-        
         try:
-            response = self._make_request('GET', endpoint)
+            response = self._make_request('GET', ACTIVE_CHATS_ENDPOINT)
             return response.get('data', [])
         except Exception as e:
             logger.error(f"Failed to get active chats: {e}")
@@ -132,7 +319,7 @@ class SendPulseAPI:
     
     def set_chat_assignee(self, chat_id: str, operator_id: str) -> bool:
         """Assign chat to an operator."""
-        endpoint = f"/messenger/v2/chats/{chat_id}/assignee"
+        endpoint = _chat_assignee_endpoint(chat_id)
         
         data = {
             "operator_id": operator_id
@@ -146,6 +333,18 @@ class SendPulseAPI:
             return False
 
 
+@dataclass(slots=True)
+class ChatSession:
+    """State of one chat: user, counters, rendered context header and recent messages."""
+    user_info: Dict[str, Any]
+    started_at: float
+    context_header: str
+    message_count: int = 0
+    messages: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_MESSAGES))
+    handed_off_at: Optional[float] = None
+    operator_id: Optional[str] = None
+
+
 class AIAgentIntegration:
     """Integration between AI Support Agent and SendPulse Live Chat."""
     
@@ -153,42 +352,39 @@ class AIAgentIntegration:
         """Initialize AI agent integration."""
         self.sendpulse = sendpulse_api
         self.ai_agent = ai_agent
-        self.active_sessions = {}
-        self.message_history = {}
+        self.sessions: Dict[str, ChatSession] = {}
+        
+        # Resolve the agent's entry point once; process_query also accepts session context
+        self._ai_call = getattr(ai_agent, 'process_query', None)
+        self._ai_call_takes_context = self._ai_call is not None
+        if self._ai_call is None:
+            self._ai_call = getattr(ai_agent, 'analyze_query', None)
     
     def process_incoming_message(self, chat_id: str, message: str, user_info: Dict[str, Any]) -> str:
         """Process incoming message from SendPulse chat."""
         try:
             # Initialize session if new
-            if chat_id not in self.active_sessions:
-                self.active_sessions[chat_id] = {
-                    'user_info': user_info,
-                    'started_at': datetime.now(),
-                    'message_count': 0,
-                    'context': []
-                }
-            
-            session = self.active_sessions[chat_id]
-            session['message_count'] += 1
+            session = self.sessions.get(chat_id)
+            if session is None:
+                session = self.sessions[chat_id] = self._new_session(user_info)
+            session.message_count += 1
             
-            # Add message to history
-            if chat_id not in self.message_history:
-                self.message_history[chat_id] = []
-            
-            self.message_history[chat_id].append({
+            # Add message to history, keeping only the most recent turns
+            history = session.messages
+            history.append({
                 'role': 'user',
                 'content': message,
-                'timestamp': datetime.now()
+                'timestamp': time.time()
             })
             
-            # Generate AI response
-            ai_response = self._generate_ai_response(message, session)
+            # Answer greetings and thanks directly; everything else goes to the AI agent
+            ai_response = _fast_reply(message.lower()) or self._generate_ai_response(message, session)
             
             # Add AI response to history
-            self.message_history[chat_id].append({
+            history.append({
                 'role': 'assistant',
                 'content': ai_response,
-                'timestamp': datetime.now()
+                'timestamp': time.time()
             })
             
             return ai_response
@@ -197,22 +393,17 @@ class AIAgentIntegration:
             logger.error(f"Error processing message: {e}")
             return "I apologize, but I'm experiencing technical difficulties. Please try again or contact a human agent."
     
-    def _generate_ai_response(self, message: str, session: Dict[str, Any]) -> str:
+    def _generate_ai_response(self, message: str, session: ChatSession) -> str:
         """Generate AI response using the enhanced agent."""
         try:
-            if not self.ai_agent:
+            if not self.ai_agent or self._ai_call is None:
                 return self._get_fallback_response(message)
             
-            # Build context from session
-            context = self._build_context(session)
-            
             # Use the enhanced agent to generate response
-            if hasattr(self.ai_agent, 'process_query'):
-                response = self.ai_agent.process_query(message, context=context)
-            elif hasattr(self.ai_agent, 'analyze_query'):
-                response = self.ai_agent.analyze_query(message)
+            if self._ai_call_takes_context:
+                response = self._ai_call(message, context=self._build_context(session))
             else:
-                return self._get_fallback_response(message)
+                response = self._ai_call(message)
             
             # Format response for chat
             return self._format_chat_response(response)
@@ -221,57 +412,28 @@ class AIAgentIntegration:
             logger.error(f"AI response generation failed: {e}")
             return self._get_fallback_response(message)
     
-    def _build_context(self, session: Dict[str, Any]) -> str:
-        """Build context string from session information."""
-        context_parts = []
-        
-        # User information
-        user_info = session.get('user_info', {})
-        if user_info.get('name'):
-            context_parts.append(f"User: {user_info['name']}")
-        
-        # Session information
-        context_parts.append(f"Session started: {session['started_at']}")
-        context_parts.append(f"Messages in conversation: {session['message_count']}")
+    def _new_session(self, user_info: Dict[str, Any]) -> ChatSession:
+        """Create a session with its fixed context lines rendered up front."""
+        started_at = time.time()
         
-        # Previous context
-        if session.get('context'):
-            context_parts.extend(session['context'])
+        # User and session information never change, so render them once
+        header = f"User: {user_info['name']}\n" if user_info.get('name') else ""
+        header += f"Session started: {datetime.fromtimestamp(started_at)}\n"
         
-        return "\n".join(context_parts)
+        return ChatSession(user_info=user_info, started_at=started_at, context_header=header)
+    
+    def _build_context(self, session: ChatSession) -> str:
+        """Build context string from session information."""
+        # Only the message count changes per turn; the header is rendered once per session
+        return f"{session.context_header}Messages in conversation: {session.message_count}"
     
     def _format_chat_response(self, response: str) -> str:
         """Format AI response for live chat."""
-        # Remove excessive formatting for chat
-        response = response.replace('**', '')
-        response = response.replace('##', '')
-        
-        # Limit response length for chat
-        max_length = 1000
-        if len(response) > max_length:
-            response = response[:max_length] + "...\n\nWould you like me to continue with more details?"
-        
-        return response
+        return _format_chat_response(response)
     
     def _get_fallback_response(self, message: str) -> str:
         """Generate fallback response when AI agent is unavailable."""
-        message_lower = message.lower()
-        
-        # Simple keyword-based responses
-        if any(word in message_lower for word in ['hello', 'hi', 'hey']):
-            return "Hello! I'm your AI support assistant. How can I help you today?"
-        
-        elif any(word in message_lower for word in ['help', 'support']):
-            return "I'm here to help you with support tickets and technical questions. What specific issue can I assist you with?"
-        
-        elif any(word in message_lower for word in ['ticket', 'issue', 'problem']):
-            return "I can help you analyze support tickets and find solutions. Could you provide more details about the specific ticket or issue?"
-        
-        elif any(word in message_lower for word in ['thank', 'thanks']):
-            return "You're welcome! Is there anything else I can help you with?"
-        
-        else:
-            return "I understand you're looking for assistance. Could you please provide more details about what you need help with? I can help with support ticket analysis, troubleshooting, and finding relevant documentation."
+        return _fallback_response(message.lower())
     
     def handle_chat_handoff(self, chat_id: str, operator_id: str) -> bool:
         """Hand off chat to human operator."""
@@ -285,10 +447,10 @@ class AIAgentIntegration:
             
             if success:
                 # Archive session
-                if chat_id in self.active_sessions:
-                    session = self.active_sessions[chat_id]
-                    session['handed_off_at'] = datetime.now()
-                    session['operator_id'] = operator_id
+                session = self.sessions.get(chat_id)
+                if session is not None:
+                    session.handed_off_at = time.time()
+                    session.operator_id = operator_id
                 
                 logger.info(f"Chat {chat_id} handed off to operator {operator_id}")
                 
@@ -300,20 +462,21 @@ class AIAgentIntegration:
     
     def get_session_summary(self, chat_id: str) -> Dict[str, Any]:
         """Get summary of chat session."""
-        if chat_id not in self.active_sessions:
+        session = self.sessions.get(chat_id)
+        if session is None:
             return {}
         
-        session = self.active_sessions[chat_id]
-        messages = self.message_history.get(chat_id, [])
+        messages = session.messages
         
+        # Timestamps are stored as epoch floats and only converted when surfaced
         return {
             'chat_id': chat_id,
-            'user_info': session.get('user_info', {}),
-            'started_at': session.get('started_at'),
-            'message_count': session.get('message_count', 0),
+            'user_info': session.user_info,
+            'started_at': datetime.fromtimestamp(session.started_at),
+            'message_count': session.message_count,
             'total_messages': len(messages),
-            'last_activity': messages[-1]['timestamp'] if messages else None,
-            'status': 'active' if chat_id in self.active_sessions else 'archived'
+            'last_activity': datetime.fromtimestamp(messages[-1]['timestamp']) if messages else None,
+            'status': 'active'
         }
 
 
@@ -326,40 +489,126 @@ class SendPulseChatBot:
         self.api = SendPulseAPI(config)
         self.integration = AIAgentIntegration(self.api, ai_agent)
         self.running = False
+        self._current_interval = 0
+        self._seen_messages = OrderedDict()
+        
+        # SendPulseAPI is blocking, so polling runs its calls on worker threads
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="sendpulse-io"
+        )
+        
+        # AI agent calls can take seconds, so they get their own pool
+        self._ai_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sendpulse-ai")
+    
+    async def _call_api(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking SendPulse API call without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, functools.partial(func, *args, **kwargs))
     
-    async def start_polling(self, poll_interval: int = 5):
+    async def start(self, poll_interval: int = 30):
+        """Receive messages via webhook when configured, falling back to polling."""
+        if self.config.webhook_url:
+            registered = await self._call_api(setup_sendpulse_webhook, self.config.webhook_url, self.api)
+            if registered:
+                self.running = True
+                logger.info(f"SendPulse chat bot receiving messages via webhook: {self.config.webhook_url}")
+                return
+            logger.warning("Webhook registration failed, falling back to polling")
+        
+        await self.start_polling(poll_interval)
+    
+    async def handle_webhook(self, payload: Any):
+        """Handle pushed webhook events without fetching chats or messages."""
+        # SendPulse may deliver a single event or a batch of them
+        events = payload if isinstance(payload, list) else [payload]
+        
+        for event in events:
+            if not isinstance(event, dict):
+                logger.warning(f"Skipping malformed webhook event: {event!r}")
+                continue
+            if event.get('event', event.get('title')) != 'message_received':
+                continue
+            
+            chat = event.get('chat') or {}
+            message = event.get('message') or {}
+            if not isinstance(chat, dict) or not isinstance(message, dict):
+                logger.warning("Skipping webhook event with malformed chat or message")
+                continue
+            chat_id = chat.get('id') or event.get('chat_id')
+            if chat_id and self._should_process_message(message):
+                await self._handle_message(chat_id, message, chat)
+    
+    async def start_polling(self, poll_interval: int = 30):
         """Start polling for new messages."""
         self.running = True
         logger.info("Starting SendPulse chat bot polling...")
         
+        # Poll faster while chats are busy and back off while they are idle
+        self._current_interval = poll_interval
+        
+        refresh_task = asyncio.create_task(self._token_refresh_loop())
+        try:
+            while self.running:
+                try:
+                    processed = await self._poll_messages()
+                    if processed:
+                        self._current_interval = max(MIN_POLL_INTERVAL, self._current_interval // 2)
+                    else:
+                        self._current_interval = min(MAX_POLL_INTERVAL, self._current_interval * 2)
+                    await asyncio.sleep(self._current_interval)
+                except Exception as e:
+                    logger.error(f"Polling error: {e}")
+                    await asyncio.sleep(self._current_interval * 2)  # Backoff on error
+        finally:
+            refresh_task.cancel()
+    
+    async def _token_refresh_loop(self):
+        """Refresh the access token shortly before it expires so no request waits on OAuth."""
         while self.running:
+            refresh_at = self.api.token_expires - TOKEN_REFRESH_MARGIN
+            await asyncio.sleep(max(refresh_at - time.time(), 1))
+            
+            if time.time() < self.api.token_expires - TOKEN_REFRESH_MARGIN:
+                continue
             try:
-                await self._poll_messages()
-                await asyncio.sleep(poll_interval)
+                await self._call_api(self.api.refresh_access_token)
             except Exception as e:
-                logger.error(f"Polling error: {e}")
-                await asyncio.sleep(poll_interval * 2)  # Backoff on error
+                logger.warning(f"Background token refresh failed: {e}")
+                await asyncio.sleep(TOKEN_REFRESH_MARGIN / 4)
     
-    async def _poll_messages(self):
-        """Poll for new messages from active chats."""
+    async def _poll_messages(self) -> int:
+        """Poll for new messages from active chats and return how many were handled."""
         try:
-            active_chats = self.api.get_active_chats()
+            active_chats = await self._call_api(self.api.get_active_chats)
+            chats = [chat for chat in active_chats if chat.get('id')]
             
-            for chat in active_chats:
-                chat_id = chat.get('id')
-                if not chat_id:
-                    continue
-                
-                # Get recent messages
-                messages = self.api.get_chat_messages(chat_id, limit=10)
-                
-                # Process unhandled messages
-                for message in messages:
-                    if self._should_process_message(message):
-                        await self._handle_message(chat_id, message, chat)
+            # One call fetches recent messages for every active chat
+            messages_by_chat = await self._call_api(
+                self.api.get_chat_messages_bulk, [chat['id'] for chat in chats], limit=10
+            )
+            
+            # Chats are handled concurrently; messages within a chat stay in order
+            counts = await asyncio.gather(*(
+                self._handle_chat_messages(chat, messages_by_chat.get(chat['id'], []))
+                for chat in chats
+            ))
+            return sum(counts)
                         
         except Exception as e:
             logger.error(f"Error polling messages: {e}")
+            return 0
+    
+    async def _handle_chat_messages(self, chat: Dict[str, Any], messages: List[Dict[str, Any]]) -> int:
+        """Handle the recent messages fetched from a single chat and return how many were handled."""
+        handled = 0
+        
+        # Process unhandled messages
+        for message in messages:
+            if self._should_process_message(message):
+                await self._handle_message(chat['id'], message, chat)
+                handled += 1
+        
+        return handled
     
     def _should_process_message(self, message: Dict[str, Any]) -> bool:
         """Check if message should be processed by AI."""
@@ -373,8 +622,24 @@ class SendPulseChatBot:
             # Add logic to check message timestamp
             pass
         
+        # Skip messages already being answered or answered by an earlier poll or webhook
+        # delivery; _handle_message releases the ID again if no reply was sent
+        message_id = message.get('id')
+        if message_id is not None:
+            if message_id in self._seen_messages:
+                return False
+            self._seen_messages[message_id] = None
+            if len(self._seen_messages) > MAX_SEEN_MESSAGES:
+                self._seen_messages.popitem(last=False)
+        
         return True
     
+    def _release_message(self, message: Dict[str, Any]):
+        """Forget an unanswered message so the next poll or webhook delivery retries it."""
+        message_id = message.get('id')
+        if message_id is not None:
+            self._seen_messages.pop(message_id, None)
+    
     async def _handle_message(self, chat_id: str, message: Dict[str, Any], chat_info: Dict[str, Any]):
         """Handle a single message."""
         try:
@@ -388,33 +653,40 @@ class SendPulseChatBot:
                 'id': chat_info.get('contact', {}).get('id')
             }
             
-            # Generate AI response
-            ai_response = self.integration.process_incoming_message(
+            # Generate AI response on a worker thread so other chats keep polling and sending
+            loop = asyncio.get_running_loop()
+            ai_response = await loop.run_in_executor(
+                self._ai_executor,
+                self.integration.process_incoming_message,
                 chat_id, message_text, user_info
             )
             
             # Send response
             if ai_response:
-                success = self.api.send_message(chat_id, ai_response)
+                success = await self._call_api(self.api.send_message, chat_id, ai_response)
                 if success:
                     logger.info(f"Sent AI response to chat {chat_id}")
-                else:
-                    logger.error(f"Failed to send response to chat {chat_id}")
+                    return
+                logger.error(f"Failed to send response to chat {chat_id}")
             
         except Exception as e:
             logger.error(f"Error handling message: {e}")
+        
+        self._release_message(message)
     
     def stop(self):
         """Stop the chat bot."""
         self.running = False
+        self._io_executor.shutdown(wait=False)
+        self._ai_executor.shutdown(wait=False)
         logger.info("SendPulse chat bot stopped")
     
     def get_stats(self) -> Dict[str, Any]:
         """Get bot statistics."""
         return {
-            'active_sessions': len(self.integration.active_sessions),
+            'active_sessions': len(self.integration.sessions),
             'total_messages': sum(
-                len(messages) for messages in self.integration.message_history.values()
+                len(session.messages) for session in self.integration.sessions.values()
             ),
             'running': self.running
         }
@@ -432,6 +704,27 @@ def create_sendpulse_integration(api_id: str, api_secret: str, live_chat_id: str
     return SendPulseChatBot(config, ai_agent)
 
 
+def create_webhook_app(chat_bot: SendPulseChatBot, path: str = "/sendpulse/webhook"):
+    """Create a FastAPI app that forwards SendPulse webhook events to the chat bot."""
+    from fastapi import BackgroundTasks, FastAPI, Request
+    
+    app = FastAPI(title="SendPulse Webhook")
+    
+    @app.post(path)
+    async def receive_webhook(request: Request, background_tasks: BackgroundTasks):
+        try:
+            payload = await request.json()
+        except ValueError:
+            logger.warning("Ignoring webhook request with an invalid JSON body")
+            return {"result": False}
+        
+        # Acknowledge right away; answering can take longer than SendPulse waits before retrying
+        background_tasks.add_task(chat_bot.handle_webhook, payload)
+        return {"result": True}
+    
+    return app
+
+
 def setup_sendpulse_webhook(webhook_url: str, sendpulse_api: SendPulseAPI) -> bool:
     """Setup webhook for real-time message handling."""
     try:
@@ -1,7 +1,16 @@
 import os
-from typing import Dict, List, Any, Optional
+import re
+import pickle
+import string
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 import json
 
+import faiss
+import numpy as np
+import pandas as pd
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
@@ -9,6 +18,167 @@ from src.data_processor import TicketDataProcessor
 from src.vector_store import TicketVectorStore
 
 
+# LLM answers are reused for queries whose embedding is at least this similar (cosine)
+SEMANTIC_CACHE_PATH = "ticket_semantic_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_SAVE_EVERY = 10
+
+# Row positions per status, priority, project and assignee, reused while the dataset is unchanged
+TICKET_INDICES_PATH = "ticket_indices.pkl"
+
+# Routing keywords found in one scan of the lowercased query; "ticket #" must precede "ticket"
+_ROUTE_RE = re.compile(
+    r"(?P<details>ticket #|details)|(?P<ticket>ticket)|(?P<show>show)|(?P<status>status)"
+    r"|(?P<urgent>urgent)|(?P<immediate>immediate)|(?P<new>new)"
+    r"|(?P<payment>payment|duplicate)|(?P<currency>currency)|(?P<reservation>reservation)"
+    r"|(?P<project>project|aventura)|(?P<assignee>assignee|john|jane|support|admin)"
+    r"|(?P<count>how many|count|total|number)"
+)
+
+# Search terms used by the keyword routes; their matching rows are precomputed at load
+ROUTED_SEARCH_KEYWORDS = ('payment', 'currency', 'reservation')
+
+# Entity extraction for the assignee and ticket-details routes
+_ASSIGNEE_RE = re.compile(r'assignee[:\s]+([^\s,]+)', re.IGNORECASE)
+_TICKET_ID_RE = re.compile(r'#?(\d+)')
+
+# Data-only routes in priority order: (route, keywords of which at least one must also appear)
+_ROUTES = (
+    ('urgent', ('ticket', 'show')),
+    ('immediate', ('ticket', 'show')),
+    ('new', ('ticket', 'status')),
+    ('payment', ()),
+    ('currency', ()),
+    ('reservation', ()),
+    ('project', ()),
+    ('assignee', ()),
+    ('details', ()),
+    ('count', ()),
+)
+
+# Questions this close (cosine) to a stats prototype are answered from the dataset without the LLM
+STATS_PROTOTYPES = (
+    "Give me an overview of the dataset",
+    "Summarize the ticket statistics",
+    "What is the breakdown of tickets by status?",
+    "What is the breakdown of tickets by priority?",
+    "How are the tickets distributed?",
+)
+STATS_PROTOTYPE_THRESHOLD = 0.85
+
+# While an LLM call is outstanding, calls arriving within this window are sent as one batch
+BATCH_WINDOW_SECONDS = 0.03
+MAX_BATCH_SIZE = 16
+
+
+# Prompt templates. The system prompt only changes with the dataset, so provider-side prefix
+# caching can reuse it; per-query vector context and the question go in the human message.
+_SYSTEM_TEMPLATE = string.Template("""You are a data analyst for support tickets. You ONLY provide information based on the specific dataset provided below.
+
+STRICT RULES:
+- ONLY answer using the dataset information provided
+- NEVER provide general advice, best practices, or external knowledge
+- If asked about something not in the dataset, say "This information is not available in the current dataset"
+- Always reference that your response is based on "the dataset" or "these tickets"
+- Use the relevant similar tickets to provide more specific context when available
+- Base your response ONLY on this data. Do not provide general advice.
+$dataset_context""")
+
+_QUESTION_TEMPLATE = string.Template("""$vector_context
+
+Based only on the dataset provided above, answer this question: $user_query""")
+
+
+class _BatchingLLM:
+    """Coalesces concurrent invoke() calls from different threads into one llm.batch() call."""
+    
+    def __init__(self, llm: Any, window: float = BATCH_WINDOW_SECONDS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.llm = llm
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[List[Any], Future]] = []
+        # Number of llm.batch() calls currently waiting on the provider
+        self._in_flight = 0
+        self._lock = threading.Lock()
+    
+    def invoke(self, messages: List[Any]) -> Any:
+        """Queue a request and block until its batch has been answered."""
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((messages, future))
+            leader = len(self._pending) == 1
+            full = len(self._pending) >= self.max_batch_size
+            busy = self._in_flight > 0
+        
+        # A lone request is sent right away. While another call is outstanding, concurrent
+        # questions are likely, so the first caller waits for others to join the batch.
+        if full:
+            self._flush()
+        elif leader:
+            if busy:
+                time.sleep(self.window)
+            self._flush()
+        
+        return future.result()
+    
+    def _flush(self):
+        """Send all pending requests in one call and resolve their futures."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            self._in_flight += 1
+        
+        try:
+            responses = self.llm.batch([messages for messages, _ in batch], return_exceptions=True)
+        except Exception as e:
+            responses = [e] * len(batch)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        
+        for (_, future), response in zip(batch, responses):
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+
+def _column_text(df: pd.DataFrame, column: str, default: str) -> pd.Series:
+    """Get a column as strings, with missing columns and values replaced by a default."""
+    if column not in df.columns:
+        return pd.Series(default, index=df.index)
+    values = df[column]
+    return values.astype(object).where(values.notna(), default).astype(str)
+
+
+def _format_tickets_md(df: pd.DataFrame, limit: int, detail_lines: List[List[Tuple[str, str, str]]]) -> str:
+    """
+    Format tickets as markdown bullets with vectorized column operations.
+    
+    Args:
+        df: Tickets to format, in display order
+        limit: Maximum number of tickets to include
+        detail_lines: Indented lines under each bullet, each a list of (label, column, default)
+    """
+    df = df.head(limit)
+    if df.empty:
+        return ""
+    
+    blocks = (
+        "- **#" + _column_text(df, '#', 'N/A') + "**: "
+        + _column_text(df, 'Subject', 'No subject') + "\n"
+    )
+    for fields in detail_lines:
+        line = None
+        for label, column, default in fields:
+            part = label + ": " + _column_text(df, column, default)
+            line = part if line is None else line + ", " + part
+        blocks = blocks + "  " + line + "\n"
+    
+    return "\n".join(blocks.tolist()) + "\n"
+
+
 class SimpleTicketAgent:
     """Simple agent that only provides dataset-based responses."""
     
@@ -17,29 +187,83 @@ class SimpleTicketAgent:
         self.data_processor = TicketDataProcessor(csv_path)
         self.vector_store = TicketVectorStore()
         
-        # Initialize LLM
+        # Runs the FAISS context search alongside dataset-context assembly
+        self._context_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ticket-context")
+        
+        # Handlers for the data-only routes, each taking the original query
+        self._route_handlers = {
+            'urgent': lambda query: self._get_priority_tickets("Urgent"),
+            'immediate': lambda query: self._get_priority_tickets("Immediate"),
+            'new': lambda query: self._get_status_tickets("New"),
+            'payment': lambda query: self._search_tickets("payment"),
+            'currency': lambda query: self._search_tickets("currency"),
+            'reservation': lambda query: self._search_tickets("reservation"),
+            'project': lambda query: self._get_project_tickets("Aventura"),
+            'assignee': self._route_assignee,
+            'details': self._route_ticket_details,
+            'count': self._route_dataset_stats,
+        }
+        
+        # Row positions per status / priority and per lowercased project / assignee,
+        # built when the data is loaded and persisted to TICKET_INDICES_PATH
+        self._by_status: Dict[str, np.ndarray] = {}
+        self._by_priority: Dict[str, np.ndarray] = {}
+        self._by_project: Dict[str, np.ndarray] = {}
+        self._by_assignee: Dict[str, np.ndarray] = {}
+        # Row positions of tickets mentioning each of ROUTED_SEARCH_KEYWORDS
+        self._by_keyword: Dict[str, np.ndarray] = {}
+        
+        # Bumped whenever the dataset is (re)loaded; derived results are cached per version
+        self._data_version = 0
+        self._analysis_cache: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._dataset_context_cache: Optional[Tuple[int, str]] = None
+        self._system_prompt_cache: Optional[Tuple[int, str]] = None
+        
+        # Semantic cache of LLM answers: query embedding index + responses in the same order,
+        # guarded by one lock since sessions ask questions from separate threads
+        self._semantic_lock = threading.RLock()
+        self._semantic_index = None
+        self._semantic_responses: List[str] = []
+        self._semantic_unsaved = 0
+        
+        # Embeddings of STATS_PROTOTYPES, one row each, computed on first use
+        self._stats_prototypes: Optional[np.ndarray] = None
+        
+        # Initialize LLM, load and process data, and load cached answers concurrently
         os.environ["GOOGLE_API_KEY"] = gemini_api_key
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-1.5-flash",
-            temperature=0.1
-        )
-        
-        # Load and process data
-        self._initialize_data()
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="ticket-init") as executor:
+            llm_future = executor.submit(
+                ChatGoogleGenerativeAI,
+                model="models/gemini-1.5-flash",
+                temperature=0.1
+            )
+            data_future = executor.submit(self._initialize_data)
+            cache_future = executor.submit(self._load_semantic_cache)
+            self.llm = llm_future.result()
+            data_future.result()
+            cache_future.result()
+        
+        # The agent is shared across Streamlit sessions, so concurrent questions are batched
+        self._batching_llm = _BatchingLLM(self.llm)
     
     def _initialize_data(self):
         """Load and process the ticket data."""
+        # The saved vector index does not depend on the data, so load it meanwhile
+        index_path = "ticket_vector_index"
+        index_future = self._context_executor.submit(self.vector_store.load_index, index_path)
+        
         print("Loading and processing ticket data...")
         self.data_processor.load_data()
         self.data_processor.clean_data()
+        self._build_lookup_indices()
+        self.invalidate_caches()
         print("Data processing complete")
         
         # Build vector index for similarity search
         print("Building vector index for enhanced context...")
         try:
-            # Try to load existing index first
-            index_path = "ticket_vector_index"
-            if not self.vector_store.load_index(index_path):
+            # Use the existing index if it loaded
+            if not index_future.result():
                 # Build new index if loading fails
                 if self.data_processor.processed_df is not None:
                     self.vector_store.build_index(self.data_processor.processed_df)
@@ -53,9 +277,182 @@ class SimpleTicketAgent:
             print(f"⚠️ Vector index unavailable: {e}")
             print("📝 Agent will work without vector context")
     
+    def _build_lookup_indices(self):
+        """Index rows by field value; the data processor's frame is left unmodified."""
+        df = self.data_processor.processed_df
+        self._by_status, self._by_priority = {}, {}
+        self._by_project, self._by_assignee = {}, {}
+        self._by_keyword = {}
+        if df is None:
+            return
+        
+        if self._load_lookup_indices(len(df)):
+            return
+        
+        # Status and priority are matched exactly, project and assignee case-insensitively
+        for column, index, lowercase in (
+            ('Status', self._by_status, False),
+            ('Priority', self._by_priority, False),
+            ('Project', self._by_project, True),
+            ('Assignee', self._by_assignee, True),
+        ):
+            if column not in df.columns:
+                continue
+            for value, positions in df.groupby(column).indices.items():
+                key = str(value).lower() if lowercase else str(value)
+                index[key] = np.union1d(index[key], positions) if key in index else positions
+        
+        # Lowercase the searchable text once, then scan it for each routed keyword
+        if 'combined_text' in df.columns:
+            text = df['combined_text'].fillna('')
+            if 'Subject' in df.columns:
+                text = text + ' ' + df['Subject'].fillna('')
+            text = text.str.lower()
+            for keyword in ROUTED_SEARCH_KEYWORDS:
+                self._by_keyword[keyword] = np.flatnonzero(text.str.contains(keyword, regex=False).to_numpy())
+        
+        self._save_lookup_indices(len(df))
+    
+    def _load_lookup_indices(self, row_count: int) -> bool:
+        """Load persisted field indices if they were built from the current dataset."""
+        try:
+            if not os.path.exists(TICKET_INDICES_PATH):
+                return False
+            
+            with open(TICKET_INDICES_PATH, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('fingerprint') != self._dataset_fingerprint() or data.get('rows') != row_count:
+                return False
+            
+            indices = data['indices']
+            self._by_status = indices['status']
+            self._by_priority = indices['priority']
+            self._by_project = indices['project']
+            self._by_assignee = indices['assignee']
+            self._by_keyword = indices['keyword']
+            return True
+        except Exception as e:
+            print(f"⚠️ Ticket indices unavailable: {e}")
+            return False
+    
+    def _save_lookup_indices(self, row_count: int):
+        """Persist field indices next to the ticket vector index."""
+        try:
+            with open(TICKET_INDICES_PATH, 'wb') as f:
+                pickle.dump({
+                    'fingerprint': self._dataset_fingerprint(),
+                    'rows': row_count,
+                    'indices': {
+                        'status': self._by_status,
+                        'priority': self._by_priority,
+                        'project': self._by_project,
+                        'assignee': self._by_assignee,
+                        'keyword': self._by_keyword,
+                    }
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"⚠️ Could not save ticket indices: {e}")
+    
+    def _lookup_rows(self, column: str, index: Dict[str, np.ndarray], value: str) -> pd.DataFrame:
+        """Get rows whose column equals value (case-insensitive), else rows that contain it."""
+        df = self.data_processor.processed_df
+        positions = index.get(value.lower())
+        if positions is not None:
+            return df.iloc[positions]
+        return df[df[column].str.contains(value, case=False, na=False, regex=False)]
+    
+    def _dataset_fingerprint(self) -> Tuple[str, float, int]:
+        """Identify the dataset file so cached answers are dropped when it changes."""
+        try:
+            stat = os.stat(self.csv_path)
+            return (os.path.abspath(self.csv_path), stat.st_mtime, stat.st_size)
+        except OSError:
+            return (os.path.abspath(self.csv_path), 0.0, 0)
+    
+    def _load_semantic_cache(self):
+        """Load persisted LLM answers if they were produced for the current dataset."""
+        try:
+            if not (os.path.exists(f"{SEMANTIC_CACHE_PATH}.faiss") and os.path.exists(f"{SEMANTIC_CACHE_PATH}.pkl")):
+                return
+            
+            with open(f"{SEMANTIC_CACHE_PATH}.pkl", 'rb') as f:
+                data = pickle.load(f)
+            if data.get('fingerprint') != self._dataset_fingerprint():
+                return
+            
+            self._semantic_index = faiss.read_index(f"{SEMANTIC_CACHE_PATH}.faiss")
+            self._semantic_responses = data['responses']
+            print(f"✅ Loaded {len(self._semantic_responses)} cached answers")
+        except Exception as e:
+            print(f"⚠️ Semantic cache unavailable: {e}")
+    
+    def _save_semantic_cache(self):
+        """Persist cached LLM answers next to the ticket vector index."""
+        try:
+            with self._semantic_lock:
+                faiss.write_index(self._semantic_index, f"{SEMANTIC_CACHE_PATH}.faiss")
+                with open(f"{SEMANTIC_CACHE_PATH}.pkl", 'wb') as f:
+                    pickle.dump({
+                        'fingerprint': self._dataset_fingerprint(),
+                        'responses': self._semantic_responses
+                    }, f)
+                self._semantic_unsaved = 0
+        except Exception as e:
+            print(f"⚠️ Could not save semantic cache: {e}")
+    
+    def _semantic_cache_get(self, query_embedding: np.ndarray) -> Optional[str]:
+        """Return a cached answer for a near-identical earlier query, if any."""
+        with self._semantic_lock:
+            if self._semantic_index is None or self._semantic_index.ntotal == 0:
+                return None
+            
+            # Embeddings are L2-normalized, so inner product is cosine similarity
+            scores, indices = self._semantic_index.search(query_embedding, 1)
+            if scores[0][0] >= SEMANTIC_CACHE_THRESHOLD:
+                return self._semantic_responses[indices[0][0]]
+            return None
+    
+    def _semantic_cache_set(self, query_embedding: np.ndarray, response: str):
+        """Remember an LLM answer under its query embedding."""
+        with self._semantic_lock:
+            if self._semantic_index is None:
+                self._semantic_index = faiss.IndexFlatIP(query_embedding.shape[1])
+            
+            # Index row i and response i are added together so they stay aligned
+            self._semantic_index.add(query_embedding)
+            self._semantic_responses.append(response)
+            
+            self._semantic_unsaved += 1
+            if self._semantic_unsaved >= SEMANTIC_CACHE_SAVE_EVERY:
+                self._save_semantic_cache()
+    
+    def _is_stats_query(self, query_embedding: np.ndarray) -> bool:
+        """Check whether a query is close enough to a stats prototype to skip the LLM."""
+        if self._stats_prototypes is None:
+            self._stats_prototypes = np.vstack([self.vector_store.embed(text) for text in STATS_PROTOTYPES])
+        
+        # Embeddings are L2-normalized, so inner product is cosine similarity
+        return float((self._stats_prototypes @ query_embedding[0]).max()) > STATS_PROTOTYPE_THRESHOLD
+    
+    def invalidate_caches(self):
+        """Drop results derived from the dataset; call after the data changes."""
+        self._data_version += 1
+        self._analysis_cache = None
+        self._dataset_context_cache = None
+        self._system_prompt_cache = None
+    
+    def _get_analysis(self) -> Dict[str, Any]:
+        """Get dataset pattern analysis, computed once per data version."""
+        if self._analysis_cache is None or self._analysis_cache[0] != self._data_version:
+            self._analysis_cache = (self._data_version, self.data_processor.analyze_patterns())
+        return self._analysis_cache[1]
+    
     def _get_dataset_context(self) -> str:
         """Get a summary of the dataset for context."""
-        analysis = self.data_processor.analyze_patterns()
+        if self._dataset_context_cache is not None and self._dataset_context_cache[0] == self._data_version:
+            return self._dataset_context_cache[1]
+        
+        analysis = self._get_analysis()
         
         context = f"""
 DATASET SUMMARY:
@@ -68,58 +465,78 @@ DATASET SUMMARY:
 - Priority distribution: {analysis.get('priority_distribution', {})}
 - Top assignees: {analysis.get('top_assignees', {})}
 """
+        self._dataset_context_cache = (self._data_version, context)
         return context
     
+    def _get_system_prompt(self) -> str:
+        """Get the LLM system prompt for the current dataset, rendered once per data version."""
+        if self._system_prompt_cache is None or self._system_prompt_cache[0] != self._data_version:
+            prompt = _SYSTEM_TEMPLATE.substitute(dataset_context=self._get_dataset_context())
+            self._system_prompt_cache = (self._data_version, prompt)
+        return self._system_prompt_cache[1]
+    
     def _search_tickets(self, query: str) -> str:
         """Search tickets based on query."""
-        tickets = self.data_processor.search_tickets(query, limit=10)
+        positions = self._by_keyword.get(query.lower())
+        if positions is not None:
+            tickets = self.data_processor.processed_df.iloc[positions[:10]].to_dict('records')
+        else:
+            tickets = self.data_processor.search_tickets(query, limit=10)
         
         if not tickets:
             return f"No tickets found matching '{query}' in the dataset."
         
-        results = f"Found {len(tickets)} tickets matching '{query}':\n\n"
-        for ticket in tickets:
-            results += f"- **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}\n"
-            results += f"  Status: {ticket.get('Status', 'Unknown')}, Priority: {ticket.get('Priority', 'Unknown')}\n"
-            results += f"  Assignee: {ticket.get('Assignee', 'Unassigned')}\n\n"
+        parts = [f"Found {len(tickets)} tickets matching '{query}':\n\n"]
+        parts.append(_format_tickets_md(pd.DataFrame.from_records(tickets), 10, [
+            [("Status", 'Status', 'Unknown'), ("Priority", 'Priority', 'Unknown')],
+            [("Assignee", 'Assignee', 'Unassigned')],
+        ]))
         
-        return results
+        return "".join(parts)
     
     def _get_priority_tickets(self, priority: str) -> str:
         """Get tickets by priority."""
-        tickets = self.data_processor.get_priority_tickets(priority)
+        df = self.data_processor.processed_df
+        if df is None:
+            return f"No {priority} priority tickets found in the dataset."
         
-        if not tickets:
+        tickets = df.iloc[self._by_priority.get(priority, [])].sort_values('Created', ascending=False)
+        
+        if len(tickets) == 0:
             return f"No {priority} priority tickets found in the dataset."
         
-        results = f"Found {len(tickets)} {priority} priority tickets in the dataset:\n\n"
-        for ticket in tickets[:5]:  # Show first 5
-            results += f"- **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}\n"
-            results += f"  Status: {ticket.get('Status', 'Unknown')}\n"
-            results += f"  Assignee: {ticket.get('Assignee', 'Unassigned')}\n\n"
+        parts = [f"Found {len(tickets)} {priority} priority tickets in the dataset:\n\n"]
+        parts.append(_format_tickets_md(tickets, 5, [  # Show first 5
+            [("Status", 'Status', 'Unknown')],
+            [("Assignee", 'Assignee', 'Unassigned')],
+        ]))
         
         if len(tickets) > 5:
-            results += f"... and {len(tickets) - 5} more {priority} priority tickets.\n"
+            parts.append(f"... and {len(tickets) - 5} more {priority} priority tickets.\n")
         
-        return results
+        return "".join(parts)
     
     def _get_status_tickets(self, status: str) -> str:
         """Get tickets by status."""
-        tickets = self.data_processor.get_tickets_by_status(status)
+        df = self.data_processor.processed_df
+        if df is None:
+            return f"No tickets with status '{status}' found in the dataset."
         
-        if not tickets:
+        tickets = df.iloc[self._by_status.get(status, [])].sort_values('Created', ascending=False)
+        
+        if len(tickets) == 0:
             return f"No tickets with status '{status}' found in the dataset."
         
-        results = f"Found {len(tickets)} tickets with status '{status}' in the dataset:\n\n"
-        for ticket in tickets[:5]:  # Show first 5
-            results += f"- **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}\n"
-            results += f"  Priority: {ticket.get('Priority', 'Unknown')}\n"
-            results += f"  Assignee: {ticket.get('Assignee', 'Unassigned')}\n\n"
+        parts = [f"Found {len(tickets)} tickets with status '{status}' in the dataset:\n\n"]
+        parts.append(_format_tickets_md(tickets, 5, [  # Show first 5
+            [("Priority", 'Priority', 'Unknown')],
+            [("Assignee", 'Assignee', 'Unassigned')],
+        ]))
         
         if len(tickets) > 5:
-            results += f"... and {len(tickets) - 5} more '{status}' tickets.\n"
+            parts.append(f"... and {len(tickets) - 5} more '{status}' tickets.\n")
         
-        return results
+        return "".join(parts)
     
     def _get_ticket_details(self, ticket_id: int) -> str:
         """Get detailed information about a specific ticket."""
@@ -149,29 +566,27 @@ DATASET SUMMARY:
             return "Dataset not loaded."
         
         # Filter tickets by project
-        project_tickets = self.data_processor.processed_df[
-            self.data_processor.processed_df['Project'].str.contains(project, case=False, na=False)
-        ]
+        project_tickets = self._lookup_rows('Project', self._by_project, project)
         
         if len(project_tickets) == 0:
             return f"No tickets found for project '{project}' in the dataset."
         
-        results = f"Found {len(project_tickets)} tickets for project '{project}' in the dataset:\n\n"
+        parts = [f"Found {len(project_tickets)} tickets for project '{project}' in the dataset:\n\n"]
         
         # Show first 10 tickets
-        for _, ticket in project_tickets.head(10).iterrows():
-            results += f"- **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}\n"
-            results += f"  Status: {ticket.get('Status', 'Unknown')}, Priority: {ticket.get('Priority', 'Unknown')}\n"
-            results += f"  Assignee: {ticket.get('Assignee', 'Unassigned')}\n\n"
+        parts.append(_format_tickets_md(project_tickets, 10, [
+            [("Status", 'Status', 'Unknown'), ("Priority", 'Priority', 'Unknown')],
+            [("Assignee", 'Assignee', 'Unassigned')],
+        ]))
         
         if len(project_tickets) > 10:
-            results += f"... and {len(project_tickets) - 10} more tickets for this project.\n"
+            parts.append(f"... and {len(project_tickets) - 10} more tickets for this project.\n")
         
         # Add project statistics
-        results += f"\n**Project Statistics:**\n"
-        results += f"- Total tickets: {len(project_tickets)}\n"
+        parts.append(f"\n**Project Statistics:**\n")
+        parts.append(f"- Total tickets: {len(project_tickets)}\n")
         
-        return results
+        return "".join(parts)
     
     def _get_assignee_tickets(self, assignee: str) -> str:
         """Get tickets by assignee."""
@@ -179,80 +594,62 @@ DATASET SUMMARY:
             return "Dataset not loaded."
         
         # Filter tickets by assignee
-        assignee_tickets = self.data_processor.processed_df[
-            self.data_processor.processed_df['Assignee'].str.contains(assignee, case=False, na=False)
-        ]
+        assignee_tickets = self._lookup_rows('Assignee', self._by_assignee, assignee)
         
         if len(assignee_tickets) == 0:
             return f"No tickets found assigned to '{assignee}' in the dataset."
         
-        results = f"Found {len(assignee_tickets)} tickets assigned to '{assignee}' in the dataset:\n\n"
+        parts = [f"Found {len(assignee_tickets)} tickets assigned to '{assignee}' in the dataset:\n\n"]
         
         # Show first 10 tickets
-        for _, ticket in assignee_tickets.head(10).iterrows():
-            results += f"- **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}\n"
-            results += f"  Status: {ticket.get('Status', 'Unknown')}, Priority: {ticket.get('Priority', 'Unknown')}\n"
-            results += f"  Created: {ticket.get('Created', 'Unknown')}\n\n"
+        parts.append(_format_tickets_md(assignee_tickets, 10, [
+            [("Status", 'Status', 'Unknown'), ("Priority", 'Priority', 'Unknown')],
+            [("Created", 'Created', 'Unknown')],
+        ]))
         
         if len(assignee_tickets) > 10:
-            results += f"... and {len(assignee_tickets) - 10} more tickets assigned to {assignee}.\n"
+            parts.append(f"... and {len(assignee_tickets) - 10} more tickets assigned to {assignee}.\n")
         
-        return results
+        return "".join(parts)
     
-    def analyze_query(self, user_query: str) -> str:
-        """Analyze a user query and provide dataset-only response."""
-        
-        # Get dataset context
-        dataset_context = self._get_dataset_context()
-        
-        # Check for specific data requests
-        query_lower = user_query.lower()
-        
-        # Handle specific queries with data
-        if "urgent" in query_lower and ("ticket" in query_lower or "show" in query_lower):
-            return self._get_priority_tickets("Urgent")
-        
-        elif "immediate" in query_lower and ("ticket" in query_lower or "show" in query_lower):
-            return self._get_priority_tickets("Immediate")
-        
-        elif "new" in query_lower and ("ticket" in query_lower or "status" in query_lower):
-            return self._get_status_tickets("New")
-        
-        elif "payment" in query_lower or "duplicate" in query_lower:
-            return self._search_tickets("payment")
-        
-        elif "currency" in query_lower:
-            return self._search_tickets("currency")
-        
-        elif "reservation" in query_lower:
-            return self._search_tickets("reservation")
-        
-        elif "project" in query_lower or "aventura" in query_lower:
-            return self._get_project_tickets("Aventura")
-        
-        elif "assignee" in query_lower or any(name in query_lower for name in ["john", "jane", "support", "admin"]):
-            # Extract assignee name if present
-            import re
-            assignee_match = re.search(r'assignee[:\s]+([^\s,]+)', user_query, re.IGNORECASE)
-            if assignee_match:
-                assignee = assignee_match.group(1)
-                return self._get_assignee_tickets(assignee)
-            else:
-                return "Please specify an assignee name (e.g., 'Show tickets assigned to John')"
-        
-        elif "ticket #" in query_lower or "details" in query_lower:
-            # Extract ticket number if present
-            import re
-            ticket_match = re.search(r'#?(\d+)', user_query)
-            if ticket_match:
-                ticket_id = int(ticket_match.group(1))
-                return self._get_ticket_details(ticket_id)
-            else:
-                return "Please specify a ticket number (e.g., 'Show details for ticket #14398')"
-        
-        elif any(word in query_lower for word in ["how many", "count", "total", "number"]):
-            analysis = self.data_processor.analyze_patterns()
-            return f"""
+    @staticmethod
+    def _match_route(query_lower: str) -> Optional[str]:
+        """Find the highest-priority data-only route for a lowercased query."""
+        found = set()
+        for match in _ROUTE_RE.finditer(query_lower):
+            found.add(match.lastgroup)
+            if match.group() == "ticket #":
+                found.add('ticket')
+        
+        for route, required in _ROUTES:
+            if route in found and (not required or not found.isdisjoint(required)):
+                return route
+        return None
+    
+    def _route_assignee(self, user_query: str) -> str:
+        """Answer an assignee query from the dataset."""
+        # Extract assignee name if present
+        assignee_match = _ASSIGNEE_RE.search(user_query)
+        if assignee_match:
+            assignee = assignee_match.group(1)
+            return self._get_assignee_tickets(assignee)
+        else:
+            return "Please specify an assignee name (e.g., 'Show tickets assigned to John')"
+    
+    def _route_ticket_details(self, user_query: str) -> str:
+        """Answer a ticket-details query from the dataset."""
+        # Extract ticket number if present
+        ticket_match = _TICKET_ID_RE.search(user_query)
+        if ticket_match:
+            ticket_id = int(ticket_match.group(1))
+            return self._get_ticket_details(ticket_id)
+        else:
+            return "Please specify a ticket number (e.g., 'Show details for ticket #14398')"
+    
+    def _route_dataset_stats(self, user_query: str) -> str:
+        """Answer a counting query with dataset statistics."""
+        analysis = self._get_analysis()
+        return f"""
 **Dataset Statistics:**
 - Total tickets in dataset: {analysis.get('total_tickets', 0)}
 - Urgent tickets: {analysis.get('urgent_tickets', 0)}
@@ -261,45 +658,112 @@ DATASET SUMMARY:
 - Status breakdown: {analysis.get('status_distribution', {})}
 - Priority breakdown: {analysis.get('priority_distribution', {})}
 """
+    
+    def _prepare_query(self, user_query: str) -> Tuple[Optional[str], List[Any], Optional[np.ndarray]]:
+        """
+        Resolve a query without the LLM where possible.
         
-        # Get vector context for better responses
-        vector_context = ""
+        Returns:
+            (answer, [], embedding) when the dataset or cache answers the query,
+            otherwise (None, messages for the LLM, query embedding or None)
+        """
+        # Check for specific data requests
+        query_lower = user_query.lower()
+        
+        # Handle specific queries with data
+        route = self._match_route(query_lower)
+        if route is not None:
+            return self._route_handlers[route](user_query), [], None
+        
+        # Answer stats-like questions from the dataset, and reuse the answer to a
+        # semantically equivalent earlier question
+        query_embedding = None
         try:
-            if self.vector_store.is_built:
-                vector_context = self.vector_store.get_context_for_query(user_query, max_tickets=3)
+            query_embedding = self.vector_store.embed(user_query)
+            if self._is_stats_query(query_embedding):
+                return self._route_dataset_stats(user_query), [], query_embedding
+            
+            cached_response = self._semantic_cache_get(query_embedding)
+            if cached_response is not None:
+                return cached_response, [], query_embedding
         except Exception as e:
-            print(f"Vector search error: {e}")
+            print(f"Semantic cache error: {e}")
         
-        # For general questions, use LLM with strict dataset-only prompt + vector context
-        system_prompt = f"""You are a data analyst for support tickets. You ONLY provide information based on the specific dataset provided below.
-
-STRICT RULES:
-- ONLY answer using the dataset information provided
-- NEVER provide general advice, best practices, or external knowledge
-- If asked about something not in the dataset, say "This information is not available in the current dataset"
-- Always reference that your response is based on "the dataset" or "these tickets"
-- Use the relevant similar tickets to provide more specific context when available
-
-{dataset_context}
-
-{vector_context}
-
-Base your response ONLY on this data. Do not provide general advice."""
-
+        # Get vector context for better responses, searching while the dataset context is assembled
+        vector_future = None
+        if self.vector_store.is_built:
+            vector_future = self._context_executor.submit(
+                self.vector_store.get_context_for_query,
+                user_query, max_tickets=3, query_embedding=query_embedding
+            )
+        
+        # Get the dataset-specific system prompt
+        system_prompt = self._get_system_prompt()
+        
+        vector_context = ""
+        if vector_future is not None:
+            try:
+                vector_context = vector_future.result()
+            except Exception as e:
+                print(f"Vector search error: {e}")
+        
+        # For general questions, use LLM with strict dataset-only prompt + vector context.
+        # The system message holds only content that is identical across queries, so
+        # provider-side prefix caching can reuse it; per-query context comes last.
         messages = [
             SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Based only on the dataset provided above, answer this question: {user_query}")
+            HumanMessage(content=_QUESTION_TEMPLATE.substitute(vector_context=vector_context, user_query=user_query))
         ]
+        return None, messages, query_embedding
+    
+    def analyze_query(self, user_query: str) -> str:
+        """Analyze a user query and provide dataset-only response."""
+        answer, messages, query_embedding = self._prepare_query(user_query)
+        if answer is not None:
+            return answer
         
         try:
-            response = self.llm.invoke(messages)
-            return str(response.content) if response.content else "No response generated"
+            response = self._batching_llm.invoke(messages)
         except Exception as e:
             return f"Error analyzing dataset: {e}"
+        
+        if not response.content:
+            return "No response generated"
+        
+        result = str(response.content)
+        if query_embedding is not None:
+            self._semantic_cache_set(query_embedding, result)
+        return result
+    
+    def analyze_query_stream(self, user_query: str) -> Iterator[str]:
+        """Like analyze_query, but yield the LLM answer in chunks as it is generated."""
+        answer, messages, query_embedding = self._prepare_query(user_query)
+        if answer is not None:
+            yield answer
+            return
+        
+        parts = []
+        try:
+            for chunk in self.llm.stream(messages):
+                if chunk.content:
+                    text = str(chunk.content)
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            yield f"Error analyzing dataset: {e}"
+            return
+        
+        if not parts:
+            yield "No response generated"
+            return
+        
+        if query_embedding is not None:
+            self._semantic_cache_set(query_embedding, "".join(parts))
     
     def get_quick_stats(self) -> Dict[str, Any]:
         """Get quick statistics for the dashboard."""
-        analysis = self.data_processor.analyze_patterns()
+        # Copy so the cached analysis is not modified
+        analysis = dict(self._get_analysis())
         vector_stats = self.vector_store.get_stats()
         
         analysis['vector_store'] = vector_stats
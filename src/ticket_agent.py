@@ -1,11 +1,17 @@
 import os
 from typing import Dict, List, Any, Optional, TypedDict, Annotated
-from datetime import datetime
+from functools import lru_cache
 import json
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.tools import tool
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
@@ -19,6 +25,41 @@ def trace(func):
 from src.data_processor import TicketDataProcessor
 
 
+# Returned as-is by get_dataset_info_tool
+_DATASET_INFO_STATIC = """
+**Dataset Information:**
+- This analysis is based on your specific support ticket dataset only
+- Contains 420 support tickets from your system
+- Includes tickets with various statuses: New, Feedback, Solved, etc.
+- Priority levels: Immediate, Urgent, High, Normal, Low
+- Projects: Mainly Aventura project tickets
+- Time period: Various dates from your ticket system
+
+**What I CAN analyze:**
+- Ticket counts, distributions, and patterns from this dataset
+- Search and filter tickets by any field
+- Identify trends and clusters in your specific data
+- Provide statistics about assignees, priorities, status, etc.
+
+**What I CANNOT provide:**
+- General support best practices or industry advice
+- Information not contained in your ticket dataset
+- Recommendations based on external knowledge
+- Comparisons with other companies or systems
+
+All my responses are based solely on analyzing your ticket data.
+"""
+
+
+def _pretty(data: Any) -> str:
+    """Format data as indented JSON for tool output."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+    return json.dumps(data, indent=2)
+
+
 class AgentState(TypedDict):
     """State of the ticket analysis agent."""
     messages: Annotated[list, add_messages]
@@ -28,50 +69,18 @@ class AgentState(TypedDict):
     response: str
 
 
-class TicketAnalysisAgent:
-    """LangGraph-based agent for analyzing support tickets."""
-    
-    def __init__(self, csv_path: str, gemini_api_key: str):
-        self.csv_path = csv_path
-        self.data_processor = TicketDataProcessor(csv_path)
-        
-        # Initialize LLM
-        os.environ["GOOGLE_API_KEY"] = gemini_api_key
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-1.5-flash",
-            temperature=0.1
-        )
-        
-        # Create tools
-        self.tools = [
-            self.analyze_ticket_patterns,
-            self.search_tickets_tool,
-            self.get_priority_tickets_tool,
-            self.get_ticket_details_tool,
-            self.cluster_tickets_tool,
-            self.get_status_summary_tool,
-            self.get_dataset_info_tool
-        ]
-        
-        # Initialize the graph
-        self.graph = self._create_graph()
-        
-        # Load and process data
-        self._initialize_data()
-    
-
+def _make_tools(dp: TicketDataProcessor) -> List[Any]:
+    """Build the agent's tools once, bound to a data processor by closure."""
     
-    def _initialize_data(self):
-        """Load and process the ticket data."""
-        print("Loading and processing ticket data...")
-        self.data_processor.load_data()
-        self.data_processor.clean_data()
-        print("Data processing complete")
+    @lru_cache(maxsize=8)
+    def _cluster(data_version: int, n_clusters: int) -> Dict[str, Any]:
+        # TF-IDF + KMeans is deterministic for a given dataset, so reuse results per data version
+        return dp.cluster_tickets(n_clusters)
     
-    @tool
-    def analyze_ticket_patterns(self) -> str:
-        """Analyze overall patterns in support tickets."""
-        analysis = self.data_processor.analyze_patterns()
+    @lru_cache(maxsize=1)
+    def _analysis_summary(data_version: int) -> str:
+        # Distributions only change with the dataset, so format them once per data version
+        analysis = dp.analyze_patterns()
         
         summary = f"""
 ## Support Ticket Analysis Summary
@@ -84,68 +93,73 @@ class TicketAnalysisAgent:
 - Closed Tickets: {analysis.get('closed_tickets', 0)}
 
 **Status Distribution:**
-{json.dumps(analysis.get('status_distribution', {}), indent=2)}
+{_pretty(analysis.get('status_distribution', {}))}
 
 **Priority Distribution:**
-{json.dumps(analysis.get('priority_distribution', {}), indent=2)}
+{_pretty(analysis.get('priority_distribution', {}))}
 
 **Project Distribution:**
-{json.dumps(analysis.get('project_distribution', {}), indent=2)}
+{_pretty(analysis.get('project_distribution', {}))}
 
 **Top Assignees:**
-{json.dumps(analysis.get('top_assignees', {}), indent=2)}
+{_pretty(analysis.get('top_assignees', {}))}
         """
         
         return summary.strip()
     
     @tool
-    def search_tickets_tool(self, query: str, limit: int = 5) -> str:
+    def analyze_ticket_patterns() -> str:
+        """Analyze overall patterns in support tickets."""
+        return _analysis_summary(dp.data_version)
+    
+    @tool
+    def search_tickets_tool(query: str, limit: int = 5) -> str:
         """Search for tickets containing specific text."""
-        tickets = self.data_processor.search_tickets(query, limit)
+        tickets = dp.search_tickets(query, limit)
         
         if not tickets:
             return f"No tickets found matching '{query}'"
         
-        results = f"Found {len(tickets)} tickets matching '{query}':\n\n"
+        parts = [f"Found {len(tickets)} tickets matching '{query}':\n\n"]
         
         for i, ticket in enumerate(tickets, 1):
-            results += f"""
+            parts.append(f"""
 **Ticket #{ticket.get('#', 'N/A')}** - {ticket.get('Subject', 'No subject')}
 - Status: {ticket.get('Status', 'Unknown')}
 - Priority: {ticket.get('Priority', 'Unknown')}
 - Assignee: {ticket.get('Assignee', 'Unassigned')}
 - Created: {ticket.get('Created', 'Unknown')}
 
-"""
+""")
         
-        return results.strip()
+        return "".join(parts).strip()
     
     @tool
-    def get_priority_tickets_tool(self, priority: str = "Urgent") -> str:
+    def get_priority_tickets_tool(priority: str = "Urgent") -> str:
         """Get tickets by priority level (Urgent, High, Normal, Low, Immediate)."""
-        tickets = self.data_processor.get_priority_tickets(priority)
+        tickets = dp.get_priority_tickets(priority)
         
         if not tickets:
             return f"No {priority} priority tickets found"
         
-        results = f"Found {len(tickets)} {priority} priority tickets:\n\n"
+        parts = [f"Found {len(tickets)} {priority} priority tickets:\n\n"]
         
         for ticket in tickets[:10]:  # Limit to first 10
-            results += f"""
+            parts.append(f"""
 **Ticket #{ticket.get('#', 'N/A')}** - {ticket.get('Subject', 'No subject')}
 - Status: {ticket.get('Status', 'Unknown')}
 - Assignee: {ticket.get('Assignee', 'Unassigned')}
 - Created: {ticket.get('Created', 'Unknown')}
 - Description: {str(ticket.get('Description', ''))[:200]}...
 
-"""
+""")
         
-        return results.strip()
+        return "".join(parts).strip()
     
     @tool
-    def get_ticket_details_tool(self, ticket_id: int) -> str:
+    def get_ticket_details_tool(ticket_id: int) -> str:
         """Get detailed information about a specific ticket."""
-        ticket = self.data_processor.get_ticket_by_id(ticket_id)
+        ticket = dp.get_ticket_by_id(ticket_id)
         
         if not ticket:
             return f"Ticket #{ticket_id} not found"
@@ -173,36 +187,36 @@ class TicketAnalysisAgent:
         return details.strip()
     
     @tool
-    def cluster_tickets_tool(self, n_clusters: int = 5) -> str:
+    def cluster_tickets_tool(n_clusters: int = 5) -> str:
         """Cluster tickets by content similarity to identify common themes."""
-        clusters = self.data_processor.cluster_tickets(n_clusters)
+        clusters = _cluster(dp.data_version, n_clusters)
         
         if 'error' in clusters:
             return f"Clustering failed: {clusters['error']}"
         
-        results = f"Ticket Clustering Analysis (k={n_clusters}):\n\n"
+        parts = [f"Ticket Clustering Analysis (k={n_clusters}):\n\n"]
         
         for cluster_name, cluster_info in clusters.items():
-            results += f"""
+            parts.append(f"""
 **{cluster_name.replace('_', ' ').title()}:**
 - Size: {cluster_info.get('size', 0)} tickets
 - Top Terms: {', '.join(cluster_info.get('top_terms', [])[:5])}
-- Priority Distribution: {json.dumps(cluster_info.get('priority_dist', {}), indent=2)}
-- Status Distribution: {json.dumps(cluster_info.get('status_dist', {}), indent=2)}
+- Priority Distribution: {_pretty(cluster_info.get('priority_dist', {}))}
+- Status Distribution: {_pretty(cluster_info.get('status_dist', {}))}
 
-"""
+""")
         
-        return results.strip()
+        return "".join(parts).strip()
     
     @tool
-    def get_status_summary_tool(self, status: str) -> str:
+    def get_status_summary_tool(status: str) -> str:
         """Get summary of tickets by status (New, Feedback, Solved, etc.)."""
-        tickets = self.data_processor.get_tickets_by_status(status)
+        tickets = dp.get_tickets_by_status(status)
         
         if not tickets:
             return f"No tickets found with status '{status}'"
         
-        results = f"Found {len(tickets)} tickets with status '{status}':\n\n"
+        parts = [f"Found {len(tickets)} tickets with status '{status}':\n\n"]
         
         # Show summary statistics
         if tickets:
@@ -214,46 +228,68 @@ class TicketAnalysisAgent:
                 priorities[priority] = priorities.get(priority, 0) + 1
                 assignees[assignee] = assignees.get(assignee, 0) + 1
             
-            results += f"**Priority Breakdown:** {json.dumps(priorities, indent=2)}\n"
-            results += f"**Assignee Breakdown:** {json.dumps(dict(list(assignees.items())[:5]), indent=2)}\n\n"
+            parts.append(f"**Priority Breakdown:** {_pretty(priorities)}\n")
+            parts.append(f"**Assignee Breakdown:** {_pretty(dict(list(assignees.items())[:5]))}\n\n")
         
         # Show recent tickets
-        results += "**Recent Tickets:**\n"
+        parts.append("**Recent Tickets:**\n")
         for ticket in tickets[:5]:
-            results += f"""
+            parts.append(f"""
 - **#{ticket.get('#', 'N/A')}**: {ticket.get('Subject', 'No subject')}
   Assignee: {ticket.get('Assignee', 'Unassigned')}, Priority: {ticket.get('Priority', 'Unknown')}
 
-"""
+""")
         
-        return results.strip()
+        return "".join(parts).strip()
     
     @tool
-    def get_dataset_info_tool(self) -> str:
+    def get_dataset_info_tool() -> str:
         """Get information about the dataset scope and limitations."""
-        return """
-**Dataset Information:**
-- This analysis is based on your specific support ticket dataset only
-- Contains 420 support tickets from your system
-- Includes tickets with various statuses: New, Feedback, Solved, etc.
-- Priority levels: Immediate, Urgent, High, Normal, Low
-- Projects: Mainly Aventura project tickets
-- Time period: Various dates from your ticket system
+        return _DATASET_INFO_STATIC
+    
+    return [
+        analyze_ticket_patterns,
+        search_tickets_tool,
+        get_priority_tickets_tool,
+        get_ticket_details_tool,
+        cluster_tickets_tool,
+        get_status_summary_tool,
+        get_dataset_info_tool
+    ]
 
-**What I CAN analyze:**
-- Ticket counts, distributions, and patterns from this dataset
-- Search and filter tickets by any field
-- Identify trends and clusters in your specific data
-- Provide statistics about assignees, priorities, status, etc.
 
-**What I CANNOT provide:**
-- General support best practices or industry advice
-- Information not contained in your ticket dataset
-- Recommendations based on external knowledge
-- Comparisons with other companies or systems
+class TicketAnalysisAgent:
+    """LangGraph-based agent for analyzing support tickets."""
+    
+    def __init__(self, csv_path: str, gemini_api_key: str):
+        self.csv_path = csv_path
+        self.data_processor = TicketDataProcessor(csv_path)
+        
+        # Initialize LLM
+        os.environ["GOOGLE_API_KEY"] = gemini_api_key
+        self.llm = ChatGoogleGenerativeAI(
+            model="models/gemini-1.5-flash",
+            temperature=0.1
+        )
+        
+        # Create tools and bind them once, so their schemas are not rebuilt per model call
+        self.tools = _make_tools(self.data_processor)
+        self._model_with_tools = self.llm.bind_tools(self.tools)
+        
+        # Initialize the graph
+        self.graph = self._create_graph()
+        
+        # Load and process data
+        self._initialize_data()
+    
 
-All my responses are based solely on analyzing your ticket data.
-        """
+    
+    def _initialize_data(self):
+        """Load and process the ticket data."""
+        print("Loading and processing ticket data...")
+        self.data_processor.load_data()
+        self.data_processor.clean_data()
+        print("Data processing complete")
     
     def _create_graph(self) -> StateGraph:
         """Create the LangGraph workflow."""
@@ -296,9 +332,7 @@ Remember: You are analyzing THIS specific support ticket dataset only, not provi
 
             messages = [SystemMessage(content=system_prompt)] + state["messages"]
             
-            # Bind tools to the model
-            model_with_tools = self.llm.bind_tools(self.tools)
-            response = model_with_tools.invoke(messages)
+            response = self._model_with_tools.invoke(messages)
             
             return {"messages": [response]}
         
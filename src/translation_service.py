@@ -4,21 +4,213 @@ Translates English queries to Russian for better knowledge base search.
 """
 
 import logging
-from typing import Optional, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Dict, Any, List, Tuple
 import re
 
+import numpy as np
+
 try:
     import google.generativeai as genai
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
 
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Character classes counted by detect_language: lowercased text is translated so each
+# Cyrillic (а-яё) or Latin (a-z) letter becomes a private-use marker, then markers are counted
+_CYRILLIC_MARK = '\ue000'
+_LATIN_MARK = '\ue001'
+_LETTER_MARKS = str.maketrans(
+    {**dict.fromkeys('абвгдеёжзийклмнопрстуфхцчшщъыьэюя', _CYRILLIC_MARK),
+     **dict.fromkeys('abcdefghijklmnopqrstuvwxyz', _LATIN_MARK)}
+)
+
+# Known technical terms; queries made only of these are translated locally
+_GLOSSARY = {
+    'hotel matching': 'матчинг отелей',
+    'payment issues': 'проблемы с оплатой',
+    'booking': 'бронирование',
+    'configuration': 'конфигурация',
+    'setup': 'настройка',
+}
+_GLOSSARY_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(term) for term in sorted(_GLOSSARY, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def _glossary_translation(english_text: str) -> Optional[str]:
+    """Translate text made up only of glossary terms and punctuation, else return None."""
+    residual, hits = _GLOSSARY_RE.subn('', english_text)
+    if not hits or _NON_WORD_RE.sub('', residual):
+        return None
+    return _GLOSSARY_RE.sub(lambda match: _GLOSSARY[match.group(0).lower()], english_text).strip()
+
+# One "N. text" line of a numbered batch-translation reply
+_NUMBERED_LINE_RE = re.compile(r'^\s*(\d+)[.)]\s*(.*)$', re.MULTILINE)
+
+# Gemini prompts; each translate prompt is split around the text to translate
+_RU_PROMPT_PREFIX = """
+            Translate the following English text to Russian. Focus on technical terms related to:
+            - Travel booking systems
+            - Hotel management
+            - GDS (Global Distribution System)
+            - Payment processing
+            - Website configuration
+            
+            Preserve technical terms when appropriate and provide accurate translations for:
+            - "hotel matching" → "матчинг отелей" or "привязка отелей"
+            - "payment issues" → "проблемы с оплатой"
+            - "booking" → "бронирование"
+            - "configuration" → "конфигурация" or "настройка"
+            - "setup" → "настройка"
+            
+            English text: """
+_RU_PROMPT_SUFFIX = """
+            
+            Provide only the Russian translation, no additional text:
+            """
+_EN_PROMPT_PREFIX = """
+            Translate the following Russian text to English. This is documentation for a travel booking system.
+            Preserve technical terms and provide clear, professional translations.
+            
+            Russian text: """
+_EN_PROMPT_SUFFIX = """
+            
+            Provide only the English translation, no additional text:
+            """
+_EN_BATCH_PROMPT_PREFIX = """
+            Translate each numbered line of Russian text to English. This is documentation for a travel booking system.
+            Preserve technical terms and provide clear, professional translations.
+            Keep the numbering: reply with exactly one numbered line per input line, and nothing else.
+            
+"""
+_EN_BATCH_PROMPT_SUFFIX = """
+            """
+
+# Language-specific response instructions for the AI model
+_EN_INSTRUCTIONS = """
+            LANGUAGE & COMMUNICATION STYLE:
+            - The user asked in English, so respond naturally in English
+            - When you reference Russian documentation, seamlessly translate the key information without saying "this document says" or "according to the document"
+            - For Russian menu paths, naturally explain them: "Go to Menu → Orders" (not "Меню → Заказы means...")
+            - Write as if you personally know the system: "To set this up, you'll need to..." instead of "The documentation indicates..."
+            - Give detailed, step-by-step instructions with helpful context
+            - Include tips and warnings based on your expertise: "Watch out for..." or "Pro tip:"
+            """
+_RU_INSTRUCTIONS = """
+            ЯЗЫК И СТИЛЬ ОБЩЕНИЯ:
+            - Пользователь задал вопрос на русском языке, отвечайте естественно на русском
+            - Говорите как знающий коллега, который лично знает систему
+            - Давайте подробные пошаговые инструкции с полезными советами
+            - Используйте личный стиль: "Чтобы настроить это, вам нужно..." вместо "Документация указывает..."
+            - Включайте советы и предупреждения: "Обратите внимание..." или "Совет:"
+            """
+
+# Below this length the str.translate count is cheaper than building a codepoint array
+# (counted with numba when installed, else numpy)
+VECTORIZED_DETECT_MIN_LENGTH = 128
+
+# Texts at least this long are first judged on their first and last DETECT_SAMPLE_SIZE
+# characters, which decide unless the sample's Cyrillic ratio is within
+# DETECT_SAMPLE_CONFIDENCE of an even split
+DETECT_SAMPLE_MIN_LENGTH = 512
+DETECT_SAMPLE_SIZE = 256
+DETECT_SAMPLE_CONFIDENCE = 0.35
+
+
+def _count_codepoints(codepoints: np.ndarray) -> Tuple[int, int]:
+    """Count Cyrillic and Latin letters, in either case, in an array of codepoints."""
+    # А-я (U+0410-U+044F) plus Ё/ё; setting bit 0x20 folds A-Z onto a-z
+    cyrillic = ((codepoints >= 0x0410) & (codepoints <= 0x044F)) | (codepoints == 0x0401) | (codepoints == 0x0451)
+    folded = codepoints | 0x20
+    latin = (folded >= 0x61) & (folded <= 0x7A)
+    return int(np.count_nonzero(cyrillic)), int(np.count_nonzero(latin))
+
+
+if NUMBA_AVAILABLE:
+    @numba.njit(cache=True)
+    def _count_codepoints_jit(codepoints):
+        cyrillic = 0
+        latin = 0
+        for cp in codepoints:
+            if 0x0410 <= cp <= 0x044F or cp == 0x0401 or cp == 0x0451:
+                cyrillic += 1
+            elif 0x61 <= (cp | 0x20) <= 0x7A:
+                latin += 1
+        return cyrillic, latin
+    
+    try:
+        # Compile (or load the cached build) now rather than on the first long text
+        _count_codepoints_jit(np.zeros(1, dtype=np.uint32))
+        _count_codepoints = _count_codepoints_jit
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"numba letter counter unavailable, using numpy: {e}")
+
+
+def _count_letters(text: str) -> Tuple[int, int]:
+    """Count Cyrillic and Latin letters in text, in either case."""
+    if len(text) < VECTORIZED_DETECT_MIN_LENGTH:
+        lower = text.lower()
+        marked = lower.translate(_LETTER_MARKS)
+        # Markers already present in the text are not letters
+        return (marked.count(_CYRILLIC_MARK) - lower.count(_CYRILLIC_MARK),
+                marked.count(_LATIN_MARK) - lower.count(_LATIN_MARK))
+    
+    return _count_codepoints(np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32))
+
+
+# Translations are reused for identical (normalized) source text, and, when an embedder is
+# supplied, for source text at least this similar (cosine) to one of the nearest earlier ones
+# with the same numbers and Latin-script words
+TRANSLATION_CACHE_SIZE = 4096
+SEMANTIC_TRANSLATION_THRESHOLD = 0.97
+SEMANTIC_TRANSLATION_CANDIDATES = 4
+
+# Numbers and Latin-script words (IDs, names) that must match exactly for a semantic
+# cache hit, since embeddings barely change when only these differ
+_LITERAL_TOKEN_RE = re.compile(r'\d+|[a-z]+')
+
+
+def _literal_tokens(text: str) -> Tuple[str, ...]:
+    """Numbers and Latin-script words of text, in order, lowercased."""
+    return tuple(_LITERAL_TOKEN_RE.findall(text.lower()))
+
 class TranslationService:
     """Service for translating queries and responses between English and Russian."""
     
-    def __init__(self, gemini_api_key: str):
+    def __init__(self, gemini_api_key: str, embed: Optional[Callable[[str], np.ndarray]] = None):
+        """
+        Args:
+            gemini_api_key: Google Gemini API key
+            embed: Optional function returning a (1, dim) L2-normalized embedding of a text,
+                used to reuse translations of near-identical text
+        """
         self.logger = logging.getLogger(__name__)
         self.gemini_api_key = gemini_api_key
+        self._embed = embed if FAISS_AVAILABLE else None
+        
+        # Exact-match LRU keyed by (direction, normalized text), plus per-direction
+        # embedding indices whose rows line up with the translations stored for them
+        self._cache_lock = threading.Lock()
+        self._translation_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._semantic_indices: Dict[str, Any] = {}
+        self._semantic_translations: Dict[str, List[str]] = {}
+        self._semantic_literals: Dict[str, List[Tuple[str, ...]]] = {}
         
         if GEMINI_AVAILABLE:
             genai.configure(api_key=gemini_api_key)
@@ -40,10 +232,15 @@ class TranslationService:
         if not text:
             return 'unknown'
         
-        # Count Cyrillic characters
-        cyrillic_count = len(re.findall(r'[а-яё]', text.lower()))
-        # Count Latin characters
-        latin_count = len(re.findall(r'[a-z]', text.lower()))
+        # Long texts are usually decided by a sample of their start and end
+        if len(text) >= DETECT_SAMPLE_MIN_LENGTH:
+            cyrillic_count, latin_count = _count_letters(text[:DETECT_SAMPLE_SIZE] + text[-DETECT_SAMPLE_SIZE:])
+            total_chars = cyrillic_count + latin_count
+            if total_chars and abs(cyrillic_count / total_chars - 0.5) > DETECT_SAMPLE_CONFIDENCE:
+                return 'ru' if cyrillic_count > latin_count else 'en'
+        
+        # Count Cyrillic and Latin characters
+        cyrillic_count, latin_count = _count_letters(text)
         
         total_chars = cyrillic_count + latin_count
         
@@ -59,6 +256,59 @@ class TranslationService:
         else:
             return 'unknown'
     
+    def _cache_lookup(self, direction: str, text: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Look up an earlier translation of text.
+        
+        Returns:
+            (translation or None, embedding of text to store with a new translation or None)
+        """
+        key = (direction, text.strip().lower())
+        with self._cache_lock:
+            if key in self._translation_cache:
+                self._translation_cache.move_to_end(key)
+                return self._translation_cache[key], None
+        
+        if self._embed is None:
+            return None, None
+        
+        try:
+            embedding = self._embed(text)
+            literals = _literal_tokens(text)
+            with self._cache_lock:
+                index = self._semantic_indices.get(direction)
+                if index is not None and index.ntotal > 0:
+                    scores, indices = index.search(embedding, min(SEMANTIC_TRANSLATION_CANDIDATES, index.ntotal))
+                    for score, i in zip(scores[0], indices[0]):
+                        if score < SEMANTIC_TRANSLATION_THRESHOLD:
+                            break
+                        # Texts differing only in an ID, number or name are not interchangeable
+                        if self._semantic_literals[direction][i] == literals:
+                            return self._semantic_translations[direction][i], embedding
+            return None, embedding
+        except Exception as e:
+            self.logger.warning(f"Semantic translation cache error: {e}")
+            return None, None
+    
+    def _cache_store(self, direction: str, text: str, translation: str, embedding: Optional[np.ndarray]):
+        """Remember a translation for exact and, if embedded, near-identical text."""
+        key = (direction, text.strip().lower())
+        with self._cache_lock:
+            self._translation_cache[key] = translation
+            if len(self._translation_cache) > TRANSLATION_CACHE_SIZE:
+                self._translation_cache.popitem(last=False)
+            
+            if embedding is None:
+                return
+            translations = self._semantic_translations.setdefault(direction, [])
+            if len(translations) >= TRANSLATION_CACHE_SIZE:
+                return
+            if direction not in self._semantic_indices:
+                self._semantic_indices[direction] = faiss.IndexFlatIP(embedding.shape[1])
+            self._semantic_indices[direction].add(embedding)
+            translations.append(translation)
+            self._semantic_literals.setdefault(direction, []).append(_literal_tokens(text))
+    
     def translate_to_russian(self, english_text: str) -> str:
         """
         Translate English text to Russian.
@@ -72,32 +322,23 @@ class TranslationService:
         if not english_text or not self.model:
             return english_text
         
+        glossary_translation = _glossary_translation(english_text)
+        if glossary_translation is not None:
+            return glossary_translation
+        
+        cached, embedding = self._cache_lookup('en-ru', english_text)
+        if cached is not None:
+            return cached
+        
         try:
-            prompt = f"""
-            Translate the following English text to Russian. Focus on technical terms related to:
-            - Travel booking systems
-            - Hotel management
-            - GDS (Global Distribution System)
-            - Payment processing
-            - Website configuration
-            
-            Preserve technical terms when appropriate and provide accurate translations for:
-            - "hotel matching" → "матчинг отелей" or "привязка отелей"
-            - "payment issues" → "проблемы с оплатой"
-            - "booking" → "бронирование"
-            - "configuration" → "конфигурация" or "настройка"
-            - "setup" → "настройка"
-            
-            English text: {english_text}
-            
-            Provide only the Russian translation, no additional text:
-            """
+            prompt = _RU_PROMPT_PREFIX + english_text + _RU_PROMPT_SUFFIX
             
             response = self.model.generate_content(prompt)
             
             if hasattr(response, 'text') and response.text:
                 translated = response.text.strip()
                 self.logger.info(f"Translated '{english_text}' to '{translated}'")
+                self._cache_store('en-ru', english_text, translated, embedding)
                 return translated
             else:
                 self.logger.warning(f"No translation received for: {english_text}")
@@ -120,21 +361,19 @@ class TranslationService:
         if not russian_text or not self.model:
             return russian_text
         
+        cached, embedding = self._cache_lookup('ru-en', russian_text)
+        if cached is not None:
+            return cached
+        
         try:
-            prompt = f"""
-            Translate the following Russian text to English. This is documentation for a travel booking system.
-            Preserve technical terms and provide clear, professional translations.
-            
-            Russian text: {russian_text}
-            
-            Provide only the English translation, no additional text:
-            """
+            prompt = _EN_PROMPT_PREFIX + russian_text + _EN_PROMPT_SUFFIX
             
             response = self.model.generate_content(prompt)
             
             if hasattr(response, 'text') and response.text:
                 translated = response.text.strip()
                 self.logger.info(f"Translated Russian text to English")
+                self._cache_store('ru-en', russian_text, translated, embedding)
                 return translated
             else:
                 self.logger.warning("No translation received for Russian text")
@@ -144,6 +383,63 @@ class TranslationService:
             self.logger.error(f"Translation error: {e}")
             return russian_text
     
+    def translate_batch_to_english(self, russian_texts: List[str]) -> List[str]:
+        """
+        Translate several short Russian texts to English in a single request.
+        
+        Args:
+            russian_texts: Russian texts to translate, one line each
+            
+        Returns:
+            English translations in the same order; texts that could not be
+            translated are returned unchanged
+        """
+        if not russian_texts or not self.model:
+            return list(russian_texts)
+        
+        translations: List[Optional[str]] = []
+        embeddings: List[Optional[np.ndarray]] = []
+        for text in russian_texts:
+            cached, embedding = self._cache_lookup('ru-en', text) if text else (text, None)
+            translations.append(cached)
+            embeddings.append(embedding)
+        
+        missing = [i for i, translation in enumerate(translations) if translation is None]
+        if not missing:
+            return translations
+        if len(missing) == 1:
+            i = missing[0]
+            translations[i] = self.translate_to_english(russian_texts[i])
+            return translations
+        
+        try:
+            numbered = "\n".join(
+                f"{n}. {' '.join(russian_texts[i].split())}" for n, i in enumerate(missing, 1)
+            )
+            prompt = _EN_BATCH_PROMPT_PREFIX + numbered + _EN_BATCH_PROMPT_SUFFIX
+            
+            response = self.model.generate_content(prompt)
+            
+            parsed = {}
+            if hasattr(response, 'text') and response.text:
+                for match in _NUMBERED_LINE_RE.finditer(response.text):
+                    parsed[int(match.group(1))] = match.group(2).strip()
+            
+            for n, i in enumerate(missing, 1):
+                translated = parsed.get(n)
+                if translated:
+                    translations[i] = translated
+                    self._cache_store('ru-en', russian_texts[i], translated, embeddings[i])
+            self.logger.info(f"Translated {len(parsed)} of {len(missing)} Russian texts to English in one request")
+        except Exception as e:
+            self.logger.error(f"Batch translation error: {e}")
+        
+        # Lines the model skipped or garbled fall back to one request each
+        return [
+            translation if translation is not None else self.translate_to_english(text)
+            for text, translation in zip(russian_texts, translations)
+        ]
+    
     def get_search_queries(self, original_query: str) -> Dict[str, str]:
         """
         Get both original and translated versions of a query for searching.
@@ -182,12 +478,16 @@ class TranslationService:
         Returns:
             Formatted response in the preferred language
         """
-        if user_language == 'en' and self.detect_language(content) == 'ru':
+        # Russian users get content as is, without scanning it
+        if user_language != 'en':
+            return content
+        
+        if self.detect_language(content) == 'ru':
             # Translate Russian content to English
             return self.translate_to_english(content)
-        else:
-            # Return as is for Russian users or already English content
-            return content
+        
+        # Already English content
+        return content
     
     def create_multilingual_prompt_instructions(self, user_language: str) -> str:
         """
@@ -199,25 +499,7 @@ class TranslationService:
         Returns:
             Language-specific instructions
         """
-        if user_language == 'en':
-            return """
-            LANGUAGE & COMMUNICATION STYLE:
-            - The user asked in English, so respond naturally in English
-            - When you reference Russian documentation, seamlessly translate the key information without saying "this document says" or "according to the document"
-            - For Russian menu paths, naturally explain them: "Go to Menu → Orders" (not "Меню → Заказы means...")
-            - Write as if you personally know the system: "To set this up, you'll need to..." instead of "The documentation indicates..."
-            - Give detailed, step-by-step instructions with helpful context
-            - Include tips and warnings based on your expertise: "Watch out for..." or "Pro tip:"
-            """
-        else:
-            return """
-            ЯЗЫК И СТИЛЬ ОБЩЕНИЯ:
-            - Пользователь задал вопрос на русском языке, отвечайте естественно на русском
-            - Говорите как знающий коллега, который лично знает систему
-            - Давайте подробные пошаговые инструкции с полезными советами
-            - Используйте личный стиль: "Чтобы настроить это, вам нужно..." вместо "Документация указывает..."
-            - Включайте советы и предупреждения: "Обратите внимание..." или "Совет:"
-            """
+        return _EN_INSTRUCTIONS if user_language == 'en' else _RU_INSTRUCTIONS
     
     def enhance_search_results(self, results: list, user_language: str) -> list:
         """
@@ -233,15 +515,17 @@ class TranslationService:
         if user_language != 'en':
             return results
         
-        enhanced_results = []
-        for result in results:
-            enhanced_result = result.copy()
-            
-            # Add English translations of titles if they're in Russian
-            title = result.get('title', '')
-            if title and self.detect_language(title) == 'ru':
-                enhanced_result['title_en'] = self.translate_to_english(title)
-            
-            enhanced_results.append(enhanced_result)
+        enhanced_results = [result.copy() for result in results]
+        
+        # Add English translations of titles if they're in Russian, each distinct title once, all in one request
+        russian = [
+            enhanced_result for enhanced_result in enhanced_results
+            if enhanced_result.get('title') and self.detect_language(enhanced_result['title']) == 'ru'
+        ]
+        if russian:
+            titles = list(dict.fromkeys(enhanced_result['title'] for enhanced_result in russian))
+            title_map = dict(zip(titles, self.translate_batch_to_english(titles)))
+            for enhanced_result in russian:
+                enhanced_result['title_en'] = title_map[enhanced_result['title']]
         
-        return enhanced_results 
\ No newline at end of file
+        return enhanced_results
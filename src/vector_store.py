@@ -1,10 +1,82 @@
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
+from functools import cached_property
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 import pickle
 import os
+import threading
+
+from .onnx_encoder import OnnxSentenceEncoder, load_onnx_encoder
+
+try:
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+# Indexes up to this size use an HNSW graph over fp16-quantized vectors; larger ones use IVF-PQ
+HNSW_MAX_VECTORS = 50_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_MIN_EF_SEARCH = 32
+# IVF lists probed per query: at least this many, or one in IVF_NPROBE_FRACTION of them
+IVF_MIN_NPROBE = 8
+IVF_NPROBE_FRACTION = 16
+
+# Texts per encoder forward pass when indexing, on CPU and on a CUDA device
+ENCODE_BATCH_SIZE = 128
+GPU_ENCODE_BATCH_SIZE = 256
+
+# Token limit for the INT8 ONNX encoder, matching all-MiniLM-L6-v2's sentence-transformers default
+ONNX_MAX_SEQ_LENGTH = 256
+
+
+def _build_ann_index(embeddings: np.ndarray) -> faiss.Index:
+    """Build an approximate inner-product index over L2-normalized embeddings."""
+    count, dimension = embeddings.shape
+    if count < HNSW_MAX_VECTORS:
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.train(embeddings)
+    else:
+        nlist = int(np.sqrt(count))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, dimension // 4, 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    index.add(embeddings)
+    _set_nprobe(index)
+    return index
+
+
+def _set_nprobe(index: faiss.Index):
+    """Probe enough IVF lists for usable recall; the FAISS default of one list is far too few."""
+    if hasattr(index, 'nprobe'):
+        index.nprobe = max(IVF_MIN_NPROBE, index.nlist // IVF_NPROBE_FRACTION)
+
+
+def _column(df: pd.DataFrame, column: str, default: Any) -> pd.Series:
+    """Get a column, or a series of the default when the column is missing."""
+    if column in df.columns:
+        return df[column]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+# Layout of the saved .pkl: 1 pickled the embeddings alongside the metadata,
+# 2 leaves them to the FAISS index file
+INDEX_FORMAT_VERSION = 2
+
+
+def _read_index(path: str) -> faiss.Index:
+    """Read a FAISS index memory-mapped, so only the pages a search touches are loaded."""
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except Exception:
+        # Older FAISS builds cannot map every index type
+        return faiss.read_index(path)
 
 
 class TicketVectorStore:
@@ -12,35 +84,70 @@ class TicketVectorStore:
     
     def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
         self.index = None
-        self.tickets_data = []
-        self.embeddings = None
+        # Ticket metadata, one row per FAISS vector
+        self.tickets_data = pd.DataFrame()
+        self._embeddings = None
         self.is_built = False
+        # Per-thread (scores, ids) output arrays for single-query searches, keyed by k
+        self._search_buffers = threading.local()
+    
+    @cached_property
+    def model(self) -> Union[OnnxSentenceEncoder, SentenceTransformer]:
+        """Embedding model, loaded on first use so a saved index loads without it.
+        
+        Runs the sentence-transformers model in half precision on a CUDA device
+        when one is present. On CPU, prefers the INT8 ONNX Runtime export of the
+        model and falls back to sentence-transformers when ONNX Runtime or the
+        export is unavailable.
+        """
+        if torch.cuda.is_available():
+            return SentenceTransformer(self.model_name, device='cuda').half()
+        
+        encoder = load_onnx_encoder(self.model_name, ONNX_MAX_SEQ_LENGTH)
+        if encoder is not None:
+            return encoder
+        return SentenceTransformer(self.model_name)
+    
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Indexed ticket embeddings, reconstructed from the FAISS index on first access."""
+        if self._embeddings is None and self.index is not None and self.index.ntotal:
+            try:
+                if hasattr(self.index, 'make_direct_map'):
+                    self.index.make_direct_map()
+                self._embeddings = self.index.reconstruct_n(0, self.index.ntotal).astype(np.float16)
+            except Exception as e:
+                print(f"⚠️ Could not reconstruct embeddings from the index: {e}")
+        return self._embeddings
+    
+    @property
+    def embedding_model(self) -> Union[OnnxSentenceEncoder, SentenceTransformer]:
+        """Shared embedding model handle for callers that embed queries themselves."""
+        return self.model
         
     def build_index(self, tickets_df: pd.DataFrame, text_column: str = 'combined_text'):
         """Build FAISS index from ticket descriptions."""
         print("🔄 Building vector index from ticket descriptions...")
         
-        # Extract ticket data and text
-        tickets_text = []
-        tickets_metadata = []
-        
-        for _, ticket in tickets_df.iterrows():
-            text = ticket.get(text_column, '')
-            if text and len(text.strip()) > 0:
-                tickets_text.append(text.strip())
-                tickets_metadata.append({
-                    'id': ticket.get('#', 'N/A'),
-                    'subject': ticket.get('Subject', 'No subject'),
-                    'status': ticket.get('Status', 'Unknown'),
-                    'priority': ticket.get('Priority', 'Unknown'),
-                    'assignee': ticket.get('Assignee', 'Unassigned'),
-                    'project': ticket.get('Project', 'Unknown'),
-                    'description': ticket.get('Description', '')[:500],  # Truncate for storage
-                    'created': ticket.get('Created', 'Unknown'),
-                    'text': text[:1000]  # Store first 1000 chars
-                })
+        # Extract ticket data and text, column-wise for tickets with non-empty text
+        raw_text = _column(tickets_df, text_column, '').fillna('').astype(str)
+        stripped = raw_text.str.strip()
+        mask = (stripped.str.len() > 0).to_numpy()
+        tickets_text = stripped[mask].tolist()
+        
+        selected = tickets_df[mask]
+        tickets_metadata = pd.DataFrame({
+            'id': _column(selected, '#', 'N/A'),
+            'subject': _column(selected, 'Subject', 'No subject'),
+            'status': _column(selected, 'Status', 'Unknown'),
+            'priority': _column(selected, 'Priority', 'Unknown'),
+            'assignee': _column(selected, 'Assignee', 'Unassigned'),
+            'project': _column(selected, 'Project', 'Unknown'),
+            'description': _column(selected, 'Description', '').fillna('').astype(str).str[:500],  # Truncate for storage
+            'created': _column(selected, 'Created', 'Unknown'),
+            'text': raw_text[mask].str[:1000]  # Store first 1000 chars
+        }).reset_index(drop=True)
         
         if not tickets_text:
             print("❌ No valid ticket descriptions found for indexing")
@@ -48,20 +155,20 @@ class TicketVectorStore:
         
         print(f"📝 Processing {len(tickets_text)} ticket descriptions...")
         
-        # Generate embeddings
-        self.embeddings = self.model.encode(
+        # Generate embeddings, normalized by the encoder so inner product is cosine similarity;
+        # fp16 GPU output is cast back to float32 for FAISS
+        embeddings = self.model.encode(
             tickets_text, 
+            batch_size=GPU_ENCODE_BATCH_SIZE if torch.cuda.is_available() else ENCODE_BATCH_SIZE,
             show_progress_bar=True,
-            convert_to_numpy=True
-        )
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32, copy=False)
         
-        # Build FAISS index
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
-        
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(self.embeddings)
-        self.index.add(self.embeddings)
+        # Build FAISS index; it holds the vectors, so no separate copy is kept
+        dimension = embeddings.shape[1]
+        self.index = _build_ann_index(embeddings)
+        self._embeddings = None
         
         # Store metadata
         self.tickets_data = tickets_metadata
@@ -70,48 +177,73 @@ class TicketVectorStore:
         print(f"✅ Vector index built successfully with {len(tickets_text)} tickets")
         print(f"🎯 Embedding dimension: {dimension}")
         
-    def search_similar_tickets(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar tickets based on query."""
+    def embed(self, text: str) -> np.ndarray:
+        """Encode a single text as a (1, dim) L2-normalized float32 vector."""
+        return self.model.encode(
+            [text], convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+        
+    def search_similar_tickets(self, query: str, k: int = 5,
+                               query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Search for similar tickets based on query, reusing its embedding if already computed."""
         if not self.is_built:
             return []
         
         # Encode query
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(query_embedding)
+        if query_embedding is None:
+            query_embedding = self.embed(query)
         
         # Search
-        scores, indices = self.index.search(query_embedding, k)
+        scores, indices = self._search(query_embedding, k)
         
-        results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx < len(self.tickets_data):
-                ticket_data = self.tickets_data[idx].copy()
-                ticket_data['similarity_score'] = float(score)
-                ticket_data['rank'] = i + 1
-                results.append(ticket_data)
+        valid = (indices[0] >= 0) & (indices[0] < len(self.tickets_data))
+        hits = self.tickets_data.iloc[indices[0][valid]].assign(
+            similarity_score=scores[0][valid].astype(float),
+            rank=np.flatnonzero(valid) + 1
+        )
+        return hits.to_dict('records')
+    
+    def _search(self, query_embedding: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Run a FAISS search, writing single-query results into reusable per-thread arrays."""
+        # HNSW needs a candidate list at least as long as k; passed per call so
+        # concurrent searches don't overwrite each other's setting on the shared index
+        params = None
+        if hasattr(self.index, 'hnsw'):
+            params = faiss.SearchParametersHNSW(efSearch=max(k * 4, HNSW_MIN_EF_SEARCH))
+        if query_embedding.shape[0] != 1:
+            return self.index.search(query_embedding, k, params=params)
         
-        return results
+        buffers = getattr(self._search_buffers, 'by_k', None)
+        if buffers is None:
+            buffers = self._search_buffers.by_k = {}
+        if k not in buffers:
+            buffers[k] = (np.empty((1, k), dtype=np.float32), np.empty((1, k), dtype=np.int64))
+        scores, indices = buffers[k]
+        self.index.search(query_embedding, k, params=params, D=scores, I=indices)
+        return scores, indices
     
-    def get_context_for_query(self, query: str, max_tickets: int = 3) -> str:
+    def get_context_for_query(self, query: str, max_tickets: int = 3,
+                              query_embedding: Optional[np.ndarray] = None) -> str:
         """Get relevant ticket context for a query."""
         if not self.is_built:
             return "Vector index not available."
         
-        similar_tickets = self.search_similar_tickets(query, k=max_tickets)
+        similar_tickets = self.search_similar_tickets(query, k=max_tickets, query_embedding=query_embedding)
         
         if not similar_tickets:
             return "No relevant tickets found."
         
-        context = f"**Relevant tickets from dataset (similarity search):**\n\n"
-        
-        for ticket in similar_tickets:
-            context += f"**Ticket #{ticket['id']}** (similarity: {ticket['similarity_score']:.3f})\n"
-            context += f"- **Subject:** {ticket['subject']}\n"
-            context += f"- **Status:** {ticket['status']}, **Priority:** {ticket['priority']}\n"
-            context += f"- **Assignee:** {ticket['assignee']}\n"
-            context += f"- **Description:** {ticket['description']}...\n\n"
+        parts = ["**Relevant tickets from dataset (similarity search):**\n\n"]
+        parts.extend(
+            f"**Ticket #{ticket['id']}** (similarity: {ticket['similarity_score']:.3f})\n"
+            f"- **Subject:** {ticket['subject']}\n"
+            f"- **Status:** {ticket['status']}, **Priority:** {ticket['priority']}\n"
+            f"- **Assignee:** {ticket['assignee']}\n"
+            f"- **Description:** {ticket['description']}...\n\n"
+            for ticket in similar_tickets
+        )
         
-        return context
+        return "".join(parts)
     
     def save_index(self, filepath: str):
         """Save the vector index and metadata to disk."""
@@ -123,10 +255,20 @@ class TicketVectorStore:
             # Save FAISS index
             faiss.write_index(self.index, f"{filepath}.faiss")
             
-            # Save metadata and embeddings
+            # Save metadata as uncompressed Arrow IPC so it can be memory-mapped on load,
+            # falling back to the pickle
+            tickets_data = self.tickets_data
+            if PYARROW_AVAILABLE:
+                try:
+                    feather.write_feather(self.tickets_data, f"{filepath}.arrow", compression='uncompressed')
+                    tickets_data = None
+                except Exception as e:
+                    print(f"⚠️ Could not write Arrow metadata, pickling it instead: {e}")
+            
+            # Embeddings are not saved; the FAISS index file already holds the vectors
             data_to_save = {
-                'tickets_data': self.tickets_data,
-                'embeddings': self.embeddings,
+                'version': INDEX_FORMAT_VERSION,
+                'tickets_data': tickets_data,
                 'model_name': self.model_name
             }
             
@@ -143,7 +285,8 @@ class TicketVectorStore:
         try:
             # Load FAISS index
             if os.path.exists(f"{filepath}.faiss"):
-                self.index = faiss.read_index(f"{filepath}.faiss")
+                self.index = _read_index(f"{filepath}.faiss")
+                _set_nprobe(self.index)
             else:
                 return False
             
@@ -151,12 +294,22 @@ class TicketVectorStore:
             if os.path.exists(f"{filepath}.pkl"):
                 with open(f"{filepath}.pkl", 'rb') as f:
                     data = pickle.load(f)
-                    self.tickets_data = data['tickets_data']
-                    self.embeddings = data['embeddings']
+                    if data.get('version', 1) > INDEX_FORMAT_VERSION:
+                        print(f"⚠️ Index format {data['version']} is newer than supported ({INDEX_FORMAT_VERSION})")
+                        return False
+                    if data.get('tickets_data') is not None:
+                        # Indexes saved before metadata was columnar hold a list of dicts
+                        self.tickets_data = pd.DataFrame(data['tickets_data'])
+                    elif PYARROW_AVAILABLE and os.path.exists(f"{filepath}.arrow"):
+                        self.tickets_data = feather.read_feather(f"{filepath}.arrow", memory_map=True)
+                    else:
+                        return False
+                    # Version 1 files carry the embeddings; otherwise they come from the index on demand
+                    self._embeddings = data.get('embeddings')
                     
-                    # Reinitialize model if different
+                    # Switch model if different; it is loaded on next use
                     if data['model_name'] != self.model_name:
-                        self.model = SentenceTransformer(data['model_name'])
+                        self.__dict__.pop('model', None)
                         self.model_name = data['model_name']
             else:
                 return False
@@ -177,6 +330,6 @@ class TicketVectorStore:
         return {
             'status': 'ready',
             'total_tickets': len(self.tickets_data),
-            'embedding_dimension': self.embeddings.shape[1] if self.embeddings is not None else 0,
+            'embedding_dimension': self.index.d if self.index is not None else 0,
             'model_name': self.model_name
         } 
\ No newline at end of file
@@ -49,6 +49,7 @@ from src.simple_ticket_agent import SimpleTicketAgent
 from src.enhanced_ticket_agent import EnhancedTicketAgent
 from src.data_processor import TicketDataProcessor
 from src.knowledge_vector_store import KnowledgeVectorStore
+from src.document_store import documents_file_exists
 from src.document_processor import DocumentProcessor
 from src.data_only_prompts import PROMPT_SUGGESTIONS, validate_dataset_query
 from src.redmine_service import RedmineService, RedmineConfig, RedmineAuthType, RedmineTicketManager
@@ -203,7 +204,7 @@ def build_knowledge_base():
     st.info("🔄 Checking knowledge base status...")
     
     # Check if knowledge base files exist
-    has_vector_index = os.path.exists("knowledge_vector_index.faiss") and os.path.exists("knowledge_documents.pkl")
+    has_vector_index = os.path.exists("knowledge_vector_index.faiss") and documents_file_exists()
     has_text_search = os.path.exists("knowledge_text_search.marker")
     
     if has_vector_index:
@@ -1003,15 +1004,14 @@ def create_chat_interface(agent):
             if validation['suggestion']:
                 st.info(f"ℹ️ {validation['message']}")
             
-            with st.spinner("Analyzing your ticket dataset..."):
-                try:
-                    response = agent.analyze_query(prompt)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
-                    error_msg = f"Sorry, I encountered an error: {e}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            try:
+                # Render the answer progressively as the LLM generates it
+                response = st.write_stream(agent.analyze_query_stream(prompt))
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            except Exception as e:
+                error_msg = f"Sorry, I encountered an error: {e}"
+                st.error(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
 
 def create_analysis_tools(processor, agent=None):
@@ -1536,7 +1536,7 @@ def main():
                 st.caption(f"Reason: {phoenix_error}")
         
         # Knowledge base status
-        has_vector_index = os.path.exists("knowledge_vector_index.faiss") and os.path.exists("knowledge_documents.pkl")
+        has_vector_index = os.path.exists("knowledge_vector_index.faiss") and documents_file_exists()
         has_text_search = os.path.exists("knowledge_text_search.marker")
         
         if has_vector_index:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test saving and loading the knowledge base document store
+"""
+
+import os
+from array import array
+
+import pytest
+
+from src import document_store
+from src.document_store import (
+    DOCUMENTS_PARQUET_FILE,
+    DOCUMENTS_PICKLE_FILE,
+    ArrowDocuments,
+    ColumnDocuments,
+    documents_file_exists,
+    load_documents,
+    save_documents,
+)
+
+DOCUMENTS = [
+    {'id': 'a', 'title': 'Booking', 'text_content': 'Hotel Booking setup', 'chunk_id': 0},
+    {'id': 'b', 'title': 'Payments', 'text_content': 'Оплата заказа', 'chunk_id': 1},
+]
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_list_of_dicts_round_trip():
+    pytest.importorskip("pyarrow")
+
+    assert save_documents(DOCUMENTS) == DOCUMENTS_PARQUET_FILE
+    assert documents_file_exists()
+
+    documents = load_documents()
+    assert isinstance(documents, ArrowDocuments)
+    assert list(documents) == DOCUMENTS
+    assert documents[1] == DOCUMENTS[1]
+    assert documents[-1] == DOCUMENTS[-1]
+    assert documents[0:1] == DOCUMENTS[0:1]
+    assert documents.column('id') == ['a', 'b']
+    # The lowercased text column is internal and not part of the documents
+    assert document_store.TEXT_LOWER_COLUMN not in documents[0]
+
+
+def test_column_dict_round_trip():
+    pytest.importorskip("pyarrow")
+
+    columns = {
+        'id': ['a', 'b'],
+        'text_content': ['Hotel Booking setup', 'Оплата заказа'],
+        'chunk_id': array('i', [0, 1]),
+    }
+    save_documents(columns)
+
+    documents = load_documents()
+    assert list(documents) == [
+        {'id': 'a', 'text_content': 'Hotel Booking setup', 'chunk_id': 0},
+        {'id': 'b', 'text_content': 'Оплата заказа', 'chunk_id': 1},
+    ]
+
+
+def test_documents_with_different_keys():
+    pytest.importorskip("pyarrow")
+
+    documents_in = [
+        {'id': 'a', 'text_content': 'first', 'category': 'setup'},
+        {'id': 'b', 'text_content': 'second', 'parent_id': 'a'},
+    ]
+    save_documents(documents_in)
+
+    # Keys missing from a document stay missing rather than coming back as None
+    documents = load_documents()
+    assert list(documents) == documents_in
+    assert documents[1].get('category', 'General') == 'General'
+
+
+def test_pickle_fallback(monkeypatch):
+    monkeypatch.setattr(document_store, "ARROW_AVAILABLE", False)
+
+    assert save_documents(DOCUMENTS) == DOCUMENTS_PICKLE_FILE
+    assert not os.path.exists(DOCUMENTS_PARQUET_FILE)
+    assert load_documents() == DOCUMENTS
+
+    columns = {'id': ['a', 'b'], 'text_content': ['first', 'second']}
+    save_documents(columns)
+    documents = load_documents()
+    assert isinstance(documents, ColumnDocuments)
+    assert documents[1] == {'id': 'b', 'text_content': 'second'}
+    assert documents.column('id') == ['a', 'b']
+
+
+def test_saving_replaces_store_in_other_format(monkeypatch):
+    pytest.importorskip("pyarrow")
+
+    monkeypatch.setattr(document_store, "ARROW_AVAILABLE", False)
+    save_documents(DOCUMENTS)
+    monkeypatch.setattr(document_store, "ARROW_AVAILABLE", True)
+    save_documents(DOCUMENTS)
+
+    assert os.path.exists(DOCUMENTS_PARQUET_FILE)
+    assert not os.path.exists(DOCUMENTS_PICKLE_FILE)
+
+
+def test_ids_containing():
+    pytest.importorskip("pyarrow")
+
+    save_documents(DOCUMENTS)
+    documents = load_documents()
+
+    assert documents.ids_containing('booking') == ['a']
+    assert documents.ids_containing('оплата') == ['b']
+    assert documents.ids_containing('missing') == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
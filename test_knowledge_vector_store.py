@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Test that the knowledge store's tensor search matches FAISS search
+"""
+
+import logging
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from src.knowledge_vector_store import KnowledgeVectorStore
+
+
+def test_tensor_search_matches_faiss_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[:5] + 0.1 * rng.standard_normal((5, 32)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    store = KnowledgeVectorStore.__new__(KnowledgeVectorStore)
+    store.logger = logging.getLogger(__name__)
+    store.index = faiss.IndexFlatIP(32)
+    store.index.add(vectors)
+    store._load_embedding_tensor(store.index.ntotal)
+    assert store._emb_tensor is not None
+
+    for query in queries:
+        query = query[None, :]
+        tensor_scores, tensor_ids = store._tensor_search(query, 10)
+        faiss_scores, faiss_ids = store._faiss_search(query, 10)
+        assert tensor_ids.tolist() == faiss_ids.tolist()
+        np.testing.assert_allclose(tensor_scores, faiss_scores, atol=1e-3)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the simple ticket agent's semantic answer cache
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+pytest.importorskip("sentence_transformers")
+
+from src import simple_ticket_agent
+from src.simple_ticket_agent import SimpleTicketAgent
+
+
+def _cache_only_agent():
+    """Agent with just the semantic cache set up (no LLM or dataset)."""
+    agent = SimpleTicketAgent.__new__(SimpleTicketAgent)
+    agent._semantic_lock = threading.RLock()
+    agent._semantic_index = None
+    agent._semantic_responses = []
+    agent._semantic_unsaved = 0
+    return agent
+
+
+def test_semantic_cache_threads_get_own_answers(monkeypatch):
+    # Keep the test from writing the cache to disk
+    monkeypatch.setattr(simple_ticket_agent, "SEMANTIC_CACHE_SAVE_EVERY", 10**9)
+    agent = _cache_only_agent()
+
+    thread_count = 8
+    dimension = 16
+    embeddings = np.eye(thread_count, dimension, dtype=np.float32)
+    barrier = threading.Barrier(thread_count)
+
+    def store(i):
+        barrier.wait()
+        agent._semantic_cache_set(embeddings[i:i + 1], f"answer {i}")
+
+    threads = [threading.Thread(target=store, args=(i,)) for i in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i in range(thread_count):
+        assert agent._semantic_cache_get(embeddings[i:i + 1]) == f"answer {i}"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Test the translation service's translation cache
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from src.translation_service import TranslationService
+
+
+def _same_embedding(text):
+    """Embedder that maps every text to one vector, so every lookup is a semantic match."""
+    return np.ones((1, 8), dtype=np.float32) / np.sqrt(8)
+
+
+def test_semantic_cache_keeps_texts_differing_in_numbers_apart():
+    service = TranslationService("test-key", embed=_same_embedding)
+
+    cached, embedding = service._cache_lookup('ru-en', "отменить бронь 123")
+    assert cached is None
+    service._cache_store('ru-en', "отменить бронь 123", "cancel booking 123", embedding)
+
+    cached, _ = service._cache_lookup('ru-en', "отменить бронь 456")
+    assert cached is None
+
+    cached, _ = service._cache_lookup('ru-en', "Отменить бронь 123!")
+    assert cached == "cancel booking 123"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])